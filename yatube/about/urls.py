@@ -1,12 +1,12 @@
 from django.urls import path
-from django.views.generic import TemplateView
 
+from .views import AboutView
 
 app_name = 'about'
 
 urlpatterns = [
-    path('author/', TemplateView.as_view(template_name='about/author.html'),
+    path('author/', AboutView.as_view(template_name='about/author.html'),
          name='author'),
-    path('tech/', TemplateView.as_view(template_name='about/tech.html'),
+    path('tech/', AboutView.as_view(template_name='about/tech.html'),
          name='tech'),
 ]
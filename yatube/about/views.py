@@ -0,0 +1,9 @@
+from django.views.generic import TemplateView
+
+
+class AboutView(TemplateView):
+    """Статическая страница. Асинхронный get не занимает поток
+    под ASGI, шаблон отрисовывает обработчик."""
+
+    async def get(self, request, *args, **kwargs):
+        return self.render_to_response(self.get_context_data(**kwargs))
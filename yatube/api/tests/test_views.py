@@ -0,0 +1,127 @@
+# api/tests/test_views.py
+import json
+
+from django.conf import settings
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post, User
+
+
+@override_settings(API_PAGE_SIZE=3, API_EXPORT_CHUNK=2)
+class ApiViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.author,
+                group=cls.group if i % 2 else None,
+            )
+            for i in range(7)
+        ]
+        for i in range(4):
+            Comment.objects.create(
+                text=f'Комментарий {i}', post=cls.posts[0], author=cls.author
+            )
+
+    def setUp(self):
+        self.client = Client()
+
+    def walk(self, url, **params):
+        '''Обходит все страницы по ссылке next'''
+        results = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            results.extend(data['results'])
+            if not data['next']:
+                return results
+            response = self.client.get(data['next'])
+
+    def test_pages_follow_cursor(self):
+        """Страницы по курсору отдают все посты по одному разу."""
+        results = self.walk(reverse('api:posts'))
+        self.assertEqual(
+            [row['id'] for row in results],
+            [post.pk for post in reversed(self.posts)],
+        )
+        self.assertEqual(results[0]['author'], 'author')
+
+    def test_filtered_lists(self):
+        """Посты группы и автора, комментарии поста."""
+        cases = (
+            (reverse('api:group_posts', args=['group']), 3),
+            (reverse('api:profile_posts', args=['author']), 7),
+            (reverse('api:post_comments', args=[self.posts[0].pk]), 4),
+        )
+        for url, count in cases:
+            with self.subTest(url=url):
+                self.assertEqual(len(self.walk(url)), count)
+        comments = self.walk(cases[2][0])
+        self.assertEqual(comments[0]['text'], 'Комментарий 0')
+
+    def test_sparse_fields(self):
+        """?fields= оставляет в ответе только запрошенные поля."""
+        data = self.client.get(
+            reverse('api:posts'), {'fields': 'id,group'}
+        ).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'group'})
+        response = self.client.get(reverse('api:posts'), {'fields': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_image_url(self):
+        """Картинка отдается адресом из хранилища, без картинки - null."""
+        Post.objects.filter(pk=self.posts[0].pk).update(
+            image='posts/ab/cd/photo.jpg'
+        )
+        results = self.walk(reverse('api:posts'), fields='id,image')
+        images = {post['id']: post['image'] for post in results}
+        self.assertEqual(
+            images.pop(self.posts[0].pk),
+            f'{settings.MEDIA_URL}posts/ab/cd/photo.jpg',
+        )
+        self.assertEqual(set(images.values()), {None})
+
+    def test_not_found(self):
+        """Несуществующие группа, автор и пост - 404 в JSON."""
+        for url in (
+            reverse('api:group_posts', args=['missing']),
+            reverse('api:profile_posts', args=['missing']),
+            reverse('api:post_comments', args=[0]),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('error', response.json())
+
+    def test_ndjson_export(self):
+        """Выгрузка NDJSON отдает все строки после курсора потоком."""
+        first = self.client.get(reverse('api:posts')).json()
+        after = first['next'].split('after=')[1]
+        response = self.client.get(
+            reverse('api:posts'),
+            {'format': 'ndjson', 'after': after, 'fields': 'id'},
+        )
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response['Content-Type'], 'application/x-ndjson; charset=utf-8'
+        )
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{'id': post.pk} for post in reversed(self.posts[:4])],
+        )
+
+    async def test_ndjson_export_asgi(self):
+        """Под ASGI выгрузка идет асинхронным итератором."""
+        response = await AsyncClient().get(
+            reverse('api:posts'), {'format': 'ndjson', 'fields': 'id'}
+        )
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response])
+        self.assertEqual(len(content.decode().splitlines()), 7)
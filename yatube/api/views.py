@@ -0,0 +1,202 @@
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from posts.models import Comment, Group, Post, User
+from posts.utils import COMMENTS_ORDERING, KEYSET_ORDERING, KeysetPaginator
+
+# Имя поля в ответе -> путь для values(): ответ строится из словарей,
+# без экземпляров моделей.
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'post': 'post_id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+}
+NDJSON = 'ndjson'
+
+
+def image_url(name):
+    return default_storage.url(name) if name else None
+
+
+# Поле ответа -> преобразование значения из values()
+CONVERTERS = {
+    'image': image_url,
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def error_response(error):
+    return JsonResponse({'error': str(error)}, status=error.status)
+
+
+def get_fields(request, fields):
+    '''Запрошенные через ?fields= поля, по умолчанию все'''
+    requested = request.GET.get('fields')
+    if not requested:
+        return dict(fields)
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}')
+    return {name: fields[name] for name in names}
+
+
+def get_limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit должен быть числом')
+    return max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+
+def get_rows(queryset, fields, ordering):
+    '''queryset.values() с полями ответа и полями ключа сортировки'''
+    keys = [field.lstrip('-') for field in ordering]
+    paths = list(dict.fromkeys([*fields.values(), *keys]))
+    return queryset.values(*paths)
+
+
+def serialize(row, fields):
+    result = {name: row[path] for name, path in fields.items()}
+    for name, convert in CONVERTERS.items():
+        if name in result:
+            result[name] = convert(result[name])
+    return result
+
+
+def ndjson_lines(rows, fields):
+    '''Строки выгрузки: iterator() читает таблицу пачками,
+    память не растет с размером выгрузки'''
+    for row in rows.iterator(chunk_size=settings.API_EXPORT_CHUNK):
+        yield json.dumps(
+            serialize(row, fields), cls=DjangoJSONEncoder, ensure_ascii=False
+        ) + '\n'
+
+
+async def async_lines(lines):
+    '''Та же выгрузка для ASGI: синхронный итератор Django под ASGI
+    прочитал бы целиком в память, поэтому строки забираются пачками
+    в потоке для синхронного кода'''
+    take = sync_to_async(
+        lambda: ''.join(islice(lines, settings.API_EXPORT_CHUNK))
+    )
+    while True:
+        chunk = await take()
+        if not chunk:
+            break
+        yield chunk
+
+
+def export_response(request, rows, fields):
+    lines = ndjson_lines(rows, fields)
+    if isinstance(request, ASGIRequest):
+        lines = async_lines(lines)
+    return StreamingHttpResponse(
+        lines, content_type='application/x-ndjson; charset=utf-8'
+    )
+
+
+def next_url(request, cursor):
+    query = request.GET.copy()
+    query['after'] = cursor
+    return f'{request.path}?{query.urlencode()}'
+
+
+def list_response(request, queryset, fields, ordering):
+    '''Страница по курсору ?after= или NDJSON-выгрузка при
+    ?format=ndjson'''
+    try:
+        fields = get_fields(request, fields)
+        limit = get_limit(request)
+    except ApiError as error:
+        return error_response(error)
+    rows = get_rows(queryset, fields, ordering)
+    paginator = KeysetPaginator(rows, limit, ordering)
+    if request.GET.get('format') == NDJSON:
+        rows = paginator.filter_after(request.GET.get('after'))
+        return export_response(request, rows, fields)
+    page = paginator.get_page(after=request.GET.get('after'))
+    return JsonResponse(
+        {
+            'results': [serialize(row, fields) for row in page],
+            'next': page.next_cursor and next_url(request, page.next_cursor),
+        },
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+def not_found(message):
+    return error_response(ApiError(message, status=404))
+
+
+@require_GET
+def posts(request):
+    return list_response(
+        request, Post.objects.all(), POST_FIELDS, KEYSET_ORDERING
+    )
+
+
+@require_GET
+def group_posts(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True
+    ).first()
+    if group_id is None:
+        return not_found('Группа не найдена')
+    return list_response(
+        request,
+        Post.objects.filter(group_id=group_id),
+        POST_FIELDS,
+        KEYSET_ORDERING,
+    )
+
+
+@require_GET
+def profile_posts(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    if author_id is None:
+        return not_found('Пользователь не найден')
+    return list_response(
+        request,
+        Post.objects.filter(author_id=author_id),
+        POST_FIELDS,
+        KEYSET_ORDERING,
+    )
+
+
+@require_GET
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        return not_found('Пост не найден')
+    return list_response(
+        request,
+        Comment.objects.filter(post_id=post_id),
+        COMMENT_FIELDS,
+        COMMENTS_ORDERING,
+    )
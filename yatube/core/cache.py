@@ -0,0 +1,116 @@
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кэш.
+
+    L1 - маленький LocMemCache внутри процесса с коротким временем жизни,
+    L2 - общий для всех воркеров кэш (alias из LOCATION).
+    Ключи с префиксами из L1_BYPASS (счетчики поколений) читаются только
+    из L2, поэтому инвалидация в одном воркере сразу видна остальным.
+    Прочие значения живут в L1 не дольше L1_TIMEOUT секунд.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = location
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        self.bypass = tuple(options.get('L1_BYPASS', ('generation:',)))
+        self.l1 = LocMemCache(f'tiered-{location}', {
+            'TIMEOUT': self.l1_timeout,
+            'OPTIONS': {
+                'MAX_ENTRIES': options.get('L1_MAX_ENTRIES', 1000),
+            },
+        })
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _local(self, key):
+        return self.l1_timeout > 0 and not str(key).startswith(self.bypass)
+
+    def _l1_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def get(self, key, default=None, version=None):
+        if not self._local(key):
+            return self.l2.get(key, default, version)
+        missing = object()
+        value = self.l1.get(key, missing, version)
+        if value is not missing:
+            return value
+        value = self.l2.get(key, missing, version)
+        if value is missing:
+            return default
+        self.l1.set(key, value, self.l1_timeout, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            if self._local(key):
+                missing = object()
+                value = self.l1.get(key, missing, version)
+                if value is not missing:
+                    found[key] = value
+                    continue
+            remote.append(key)
+        if remote:
+            fetched = self.l2.get_many(remote, version)
+            for key, value in fetched.items():
+                if self._local(key):
+                    self.l1.set(key, value, self.l1_timeout, version)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        if self._local(key):
+            self.l1.set(key, value, self._l1_timeout(timeout), version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        for key, value in data.items():
+            if self._local(key) and key not in failed:
+                self.l1.set(key, value, self._l1_timeout(timeout), version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l1.delete(key, version)
+        return self.l2.add(key, value, timeout, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self.l1.delete(key, version)
+        return self.l2.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.l1.delete(key, version)
+        return self.l2.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        if self._local(key) and self.l1.has_key(key, version):
+            return True
+        return self.l2.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        self.l1.delete(key, version)
+        return self.l2.incr(key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        self.l1.delete(key, version)
+        return self.l2.decr(key, delta, version)
+
+    def clear(self):
+        self.l1.clear()
+        return self.l2.clear()
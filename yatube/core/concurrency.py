@@ -0,0 +1,34 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connection
+
+
+def _in_atomic_block():
+    return connection.in_atomic_block
+
+
+def _in_own_thread(func):
+    def wrapper():
+        try:
+            return func()
+        finally:
+            # У каждого потока пула свое соединение с БД.
+            close_old_connections()
+    return wrapper
+
+
+async def run_concurrently(*funcs):
+    """Выполняет синхронные функции без аргументов параллельно.
+
+    Каждая функция работает в отдельном потоке со своим соединением
+    с БД, результаты возвращаются в порядке функций. Внутри транзакции
+    (например, в TestCase) другие соединения не видят незафиксированных
+    данных, поэтому функции выполняются по очереди в потоке запроса.
+    """
+    if await sync_to_async(_in_atomic_block)():
+        return [await sync_to_async(func)() for func in funcs]
+    return await asyncio.gather(*(
+        sync_to_async(_in_own_thread(func), thread_sensitive=False)()
+        for func in funcs
+    ))
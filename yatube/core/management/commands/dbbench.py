@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts.models import Post
+
+# Настройки SQLite по умолчанию: журнал отката, полная синхронизация.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'delete',
+    'synchronous': 'full',
+}
+WRITES_TABLE = 'dbbench_writes'
+
+
+def open_connection(path, pragmas):
+    db = sqlite3.connect(path, timeout=20, check_same_thread=False)
+    for name, value in pragmas.items():
+        db.execute(f'PRAGMA {name} = {value}')
+    return db
+
+
+class Worker(threading.Thread):
+    def __init__(self, path, pragmas, deadline, action):
+        super().__init__(daemon=True)
+        self.path = path
+        self.pragmas = pragmas
+        self.deadline = deadline
+        self.action = action
+        self.latencies = []
+        self.errors = 0
+
+    def run(self):
+        db = open_connection(self.path, self.pragmas)
+        try:
+            while time.perf_counter() < self.deadline:
+                started = time.perf_counter()
+                try:
+                    self.action(db)
+                except sqlite3.OperationalError:
+                    # database is locked: ожидание превысило timeout.
+                    self.errors += 1
+                    continue
+                self.latencies.append(time.perf_counter() - started)
+        finally:
+            db.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность чтения ленты при параллельной '
+        'записи для настроек SQLite по умолчанию и SQLITE_PRAGMAS. '
+        'Работает с копией базы, основная база не меняется'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument(
+            '--duration', type=float, default=5,
+            help='Секунд на каждый вариант настроек',
+        )
+        parser.add_argument(
+            '--write-batch', type=int, default=10,
+            help='Строк в одной транзакции записи',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Бенчмарк только для SQLite')
+        queryset = Post.objects.select_related('author', 'group')
+        sql, params = queryset[:settings.POST_ON_PAGE].query.sql_with_params()
+        read_sql = sql.replace('%s', '?')
+        with tempfile.TemporaryDirectory() as directory:
+            for name, pragmas in (
+                ('default', DEFAULT_PRAGMAS),
+                ('tuned', settings.SQLITE_PRAGMAS),
+            ):
+                path = os.path.join(directory, f'{name}.sqlite3')
+                self.copy_database(path)
+                result = self.run(
+                    path, pragmas, read_sql, params, options
+                )
+                self.stdout.write(f'{name}: {result}')
+
+    def copy_database(self, path):
+        '''Копия базы через backup API: согласованный снимок даже
+        при работающем сайте'''
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        try:
+            connection.connection.backup(target)
+            target.execute(
+                f'CREATE TABLE {WRITES_TABLE} '
+                f'(id INTEGER PRIMARY KEY, payload TEXT, created REAL)'
+            )
+            target.commit()
+        finally:
+            target.close()
+
+    def run(self, path, pragmas, read_sql, params, options):
+        payload = 'x' * 200
+
+        def read(db):
+            db.execute(read_sql, params).fetchall()
+
+        def write(db):
+            with db:
+                db.executemany(
+                    f'INSERT INTO {WRITES_TABLE} (payload, created) '
+                    f'VALUES (?, ?)',
+                    [(payload, time.time())] * options['write_batch'],
+                )
+
+        # Режим журнала хранится в файле базы: задаем его до запуска.
+        open_connection(path, pragmas).close()
+        deadline = time.perf_counter() + options['duration']
+        readers = [
+            Worker(path, pragmas, deadline, read)
+            for _ in range(options['readers'])
+        ]
+        writers = [
+            Worker(path, pragmas, deadline, write)
+            for _ in range(options['writers'])
+        ]
+        started = time.perf_counter()
+        for worker in readers + writers:
+            worker.start()
+        for worker in readers + writers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        reads = [
+            latency for worker in readers for latency in worker.latencies
+        ]
+        writes = sum(len(worker.latencies) for worker in writers)
+        errors = sum(worker.errors for worker in readers + writers)
+        p95 = 0.0
+        if len(reads) > 1:
+            p95 = statistics.quantiles(reads, n=20)[-1] * 1000
+        return (
+            f'чтений {len(reads) / elapsed:.1f}/с (p95 {p95:.2f} мс), '
+            f'транзакций записи {writes / elapsed:.1f}/с, '
+            f'ошибок блокировки {errors}'
+        )
@@ -0,0 +1,196 @@
+import asyncio
+import io
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+)
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+
+HOST = 'localhost'
+
+
+def session_cookie(username):
+    '''Cookie сессии, в которой пользователь уже вошел'''
+    User = get_user_model()
+    try:
+        user = User.objects.get(username=username)
+    except User.DoesNotExist:
+        raise CommandError(f'Пользователь {username} не найден')
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+
+def wsgi_request(application, url, cookie):
+    '''Запрос к WSGI-приложению в процессе, возвращает код ответа'''
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': HOST,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if cookie:
+        environ['HTTP_COOKIE'] = cookie
+    status = []
+    result = application(
+        environ, lambda code, headers: status.append(int(code[:3]))
+    )
+    try:
+        for _ in result:
+            pass
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return status[0]
+
+
+async def asgi_request(application, url, cookie):
+    '''Запрос к ASGI-приложению в процессе, возвращает код ответа'''
+    parts = urlsplit(url)
+    headers = [(b'host', HOST.encode())]
+    if cookie:
+        headers.append((b'cookie', cookie.encode()))
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': parts.path,
+        'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(),
+        'root_path': '',
+        'headers': headers,
+        'client': ('127.0.0.1', 0),
+        'server': (HOST, 80),
+    }
+    sent = asyncio.Event()
+    status = []
+
+    async def receive():
+        if not sent.is_set():
+            sent.set()
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Клиент не отключается, пока ответ не отправлен.
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    status = func(*args)
+    return status, time.perf_counter() - started
+
+
+async def async_timed(func, *args):
+    started = time.perf_counter()
+    status = await func(*args)
+    return status, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест: сравнивает запросы в секунду через WSGI '
+        'и ASGI обработчики Django внутри процесса'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls',
+            nargs='*',
+            default=['/'],
+            help='Адреса страниц, по умолчанию главная',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Запросов на каждый адрес',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=10,
+            help='Одновременных запросов',
+        )
+        parser.add_argument(
+            '--user',
+            help='Запросы от имени пользователя (мимо кэша страниц)',
+        )
+        parser.add_argument(
+            '--handler', choices=('wsgi', 'asgi', 'both'), default='both',
+        )
+
+    def handle(self, *args, **options):
+        cookie = options['user'] and session_cookie(options['user'])
+        handlers = ('wsgi', 'asgi')
+        if options['handler'] != 'both':
+            handlers = (options['handler'],)
+        for url in options['urls']:
+            for handler in handlers:
+                run = getattr(self, f'run_{handler}')
+                started = time.perf_counter()
+                results = run(
+                    url, cookie, options['requests'], options['concurrency']
+                )
+                elapsed = time.perf_counter() - started
+                self.report(handler, url, results, elapsed)
+
+    def run_wsgi(self, url, cookie, requests, concurrency):
+        application = get_wsgi_application()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(timed, wsgi_request, application, url, cookie)
+                for _ in range(requests)
+            ]
+            return [future.result() for future in futures]
+
+    def run_asgi(self, url, cookie, requests, concurrency):
+        application = get_asgi_application()
+
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def limited():
+                async with semaphore:
+                    return await async_timed(
+                        asgi_request, application, url, cookie
+                    )
+            return await asyncio.gather(*(limited() for _ in range(requests)))
+        return asyncio.run(run())
+
+    def report(self, handler, url, results, elapsed):
+        latencies = sorted(latency * 1000 for status, latency in results)
+        errors = sum(1 for status, latency in results if status >= 500)
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        self.stdout.write(
+            f'{handler.upper()} {url}: {len(results) / elapsed:.1f} req/s, '
+            f'p50 {statistics.median(latencies):.1f} ms, '
+            f'p95 {p95:.1f} ms, ошибок {errors}'
+        )
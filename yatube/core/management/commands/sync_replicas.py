@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в реплики из DATABASE_REPLICAS: '
+        'локальная замена репликации'
+    )
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('Копирование реплик только для SQLite')
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('Реплики не заданы: DATABASE_REPLICAS пуст')
+        if primary.in_atomic_block:
+            # backup API ждал бы конца собственной транзакции вечно.
+            raise CommandError('Нельзя копировать базу внутри транзакции')
+        primary.ensure_connection()
+        for alias in settings.REPLICA_DATABASES:
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f'{alias}: скопирована')
@@ -0,0 +1,233 @@
+import cProfile
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import (
+    async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.base import Template
+from django.urls import Resolver404, resolve
+
+from .routers import PRIMARY_COOKIE, replicas_allowed
+
+logger = logging.getLogger('yatube.profiling')
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    """Счетчики одного профилируемого запроса."""
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.queries = 0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def _timed_render(render):
+    def wrapper(self, context):
+        profile = current_profile.get()
+        # Вложенные шаблоны (include, extends) уже учтены внешним.
+        if profile is None or profile.template_depth:
+            return render(self, context)
+        profile.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile.template_time += time.perf_counter() - started
+            profile.template_depth -= 1
+    wrapper.profiled = True
+    return wrapper
+
+
+if not getattr(Template.render, 'profiled', False):
+    Template.render = _timed_render(Template.render)
+
+
+def _count_cache(cache, profile, stack):
+    """Подменяет get/get_many экземпляра кэша на время запроса.
+
+    Экземпляры кэшей свои у каждого потока, поэтому подмена не видна
+    параллельным запросам.
+    """
+    get, get_many = cache.get, cache.get_many
+    missing = object()
+
+    def counted_get(key, default=None, version=None):
+        value = get(key, missing, version)
+        if value is missing:
+            profile.cache_misses += 1
+            return default
+        profile.cache_hits += 1
+        return value
+
+    def counted_get_many(keys, version=None):
+        keys = list(keys)
+        found = get_many(keys, version)
+        profile.cache_hits += len(found)
+        profile.cache_misses += len(keys) - len(found)
+        return found
+
+    cache.get, cache.get_many = counted_get, counted_get_many
+    stack.callback(vars(cache).pop, 'get_many')
+    stack.callback(vars(cache).pop, 'get')
+
+
+class ProfilingMiddleware:
+    """Профилирует долю запросов PROFILING_SAMPLE_RATE.
+
+    Для выбранных запросов считает общее время, время и число SQL-запросов,
+    время отрисовки шаблонов, попадания и промахи кэша. Результат уходит
+    в заголовок Server-Timing и строкой JSON в лог yatube.profiling.
+    Если задан PROFILING_DUMP_DIR, запрос выполняется под cProfile,
+    и дамп сохраняется для запросов дольше PROFILING_SLOW_MS.
+
+    Под ASGI выбранный запрос профилируется в синхронном потоке:
+    запросы к БД из параллельных потоков run_concurrently не считаются.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        return self.profile(request, self.get_response)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        return await sync_to_async(self.profile)(
+            request, async_to_sync(self.get_response)
+        )
+
+    def sampled(self):
+        rate = settings.PROFILING_SAMPLE_RATE
+        return bool(rate) and random.random() < rate
+
+    def profile(self, request, get_response):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        profiler = cProfile.Profile() if settings.PROFILING_DUMP_DIR else None
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.db_wrapper)
+                    )
+                _count_cache(caches['default'], profile, stack)
+                if profiler:
+                    profiler.enable()
+                    stack.callback(profiler.disable)
+                response = get_response(request)
+        finally:
+            current_profile.reset(token)
+        total = (time.perf_counter() - started) * 1000
+        response['Server-Timing'] = ', '.join((
+            f'total;dur={total:.1f}',
+            f'db;dur={profile.db_time * 1000:.1f};'
+            f'desc="{profile.queries} queries"',
+            f'tpl;dur={profile.template_time * 1000:.1f}',
+            f'cache;desc="hits={profile.cache_hits} '
+            f'misses={profile.cache_misses}"',
+        ))
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total, 1),
+            'db_ms': round(profile.db_time * 1000, 1),
+            'queries': profile.queries,
+            'template_ms': round(profile.template_time * 1000, 1),
+            'cache_hits': profile.cache_hits,
+            'cache_misses': profile.cache_misses,
+        }
+        if profiler and total >= settings.PROFILING_SLOW_MS:
+            name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}'
+            name += f'-{request.path.strip("/").replace("/", "_")}.prof'
+            path = os.path.join(settings.PROFILING_DUMP_DIR, name)
+            os.makedirs(settings.PROFILING_DUMP_DIR, exist_ok=True)
+            profiler.dump_stats(path)
+            record['profile'] = path
+        logger.info(json.dumps(record, ensure_ascii=False))
+        return response
+
+
+class ReplicaMiddleware:
+    """Разрешает чтение с реплик для представлений из REPLICA_VIEWS.
+
+    Реплики не используются для пользователя с cookie PRIMARY_COOKIE:
+    ее ставит ответ представления, вызвавшего pin_primary() после
+    записи, чтобы пользователь сразу видел свои изменения. Чужие
+    недавние записи учитывает posts.cache.fresh_reads().
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with replicas_allowed(self.use_replicas(request)):
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        with replicas_allowed(self.use_replicas(request)):
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+    def use_replicas(self, request):
+        if (not settings.REPLICA_DATABASES
+                or request.method not in ('GET', 'HEAD')
+                or request.COOKIES.get(PRIMARY_COOKIE)):
+            return False
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return match.view_name in settings.REPLICA_VIEWS
+
+    def pin(self, request, response):
+        if getattr(request, 'pin_primary', False):
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 from django.db import models
 from django.contrib.auth import get_user_model
 
@@ -13,3 +15,39 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+@contextmanager
+def keep_dates(model, *field_names):
+    """Отключает auto_now и auto_now_add у полей модели.
+
+    Нужен при загрузке данных: bulk_create и save иначе заменят
+    переданную дату текущим временем. Меняет поле на уровне класса,
+    поэтому подходит только для команд, а не для запросов.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class StoredFile(models.Model):
+    """Число ссылок на файл хранилища с адресацией по содержимому.
+
+    Одинаковые загрузки - один файл, поэтому файл удаляется только
+    вместе с последней ссылкой на него.
+    """
+    name = models.CharField('Имя файла', max_length=255, primary_key=True)
+    references = models.PositiveIntegerField('Число ссылок', default=1)
+
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.references}'
@@ -0,0 +1,50 @@
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+
+PRIMARY_COOKIE = 'use_primary'
+# Сессия читается с основной базы: иначе после входа реплика
+# с отставанием "разлогинит" пользователя.
+PRIMARY_ONLY_APPS = ('sessions',)
+
+_replicas_allowed = contextvars.ContextVar('replicas_allowed', default=False)
+
+
+@contextmanager
+def replicas_allowed(allowed=True):
+    '''Разрешает читать с реплик внутри блока'''
+    token = _replicas_allowed.set(allowed)
+    try:
+        yield
+    finally:
+        _replicas_allowed.reset(token)
+
+
+def pin_primary(request):
+    '''Отмечает запрос с записью: следующие REPLICA_PIN_SECONDS
+    пользователь читает основную базу и видит свои изменения'''
+    request.pin_primary = True
+
+
+class ReplicaRouter:
+    """Чтение с реплик из REPLICA_DATABASES там, где его разрешил
+    ReplicaMiddleware, запись и все остальное - в default."""
+
+    def db_for_read(self, model, **hints):
+        if (not _replicas_allowed.get()
+                or not settings.REPLICA_DATABASES
+                or model._meta.app_label in PRIMARY_ONLY_APPS):
+            return None
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICA_DATABASES
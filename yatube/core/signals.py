@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .routers import pin_primary
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    demo = connection.settings_dict['NAME'] == settings.DEMO_DATABASE
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            if demo and name == 'journal_mode':
+                # WAL записывается в заголовок файла из git.
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(user_logged_in)
+def pin_primary_on_login(sender, request, user, **kwargs):
+    # Вход пишет в сессию и last_login: следующие страницы
+    # пользователь читает с основной базы.
+    if request is not None:
+        pin_primary(request)
@@ -0,0 +1,227 @@
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import (
+    ImproperlyConfigured, SuspiciousFileOperation
+)
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage
+from django.core.files.utils import validate_file_name
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import StoredFile
+
+# Файл не меняется, пока существует его имя: браузер и CDN могут
+# хранить его сколько угодно.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CONTENT_NAME = re.compile(
+    r'(?:^|/)(?P<a>[0-9a-f]{2})/(?P<b>[0-9a-f]{2})/'
+    r'(?P<digest>[0-9a-f]{64})(?:\.\w+)?$'
+)
+
+
+def content_name(name, content):
+    '''Имя файла по SHA-256 содержимого: каталог из upload_to,
+    два уровня подкаталогов по началу хэша и исходное расширение'''
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    digest = digest.hexdigest()
+    directory = posixpath.dirname(name)
+    if is_content_name(name):
+        # Файл уже назван по содержимому: подкаталоги хэша не нужны.
+        directory = posixpath.dirname(posixpath.dirname(directory))
+    extension = os.path.splitext(name)[1].lower()
+    return posixpath.join(
+        directory, digest[:2], digest[2:4], f'{digest}{extension}'
+    )
+
+
+def is_content_name(name):
+    '''Назван ли файл по своему содержимому'''
+    match = CONTENT_NAME.search(name)
+    return bool(match) and match['digest'].startswith(
+        match['a'] + match['b']
+    )
+
+
+def acquire(name):
+    '''Добавляет ссылку на файл.
+
+    UPDATE блокирует строку до конца транзакции: удаление файла
+    без ссылок ждет ее и видит новую ссылку.
+    '''
+    with transaction.atomic():
+        while not StoredFile.objects.filter(name=name).update(
+                references=F('references') + 1):
+            try:
+                with transaction.atomic():
+                    StoredFile.objects.create(name=name)
+                return
+            except IntegrityError:
+                # Строку одновременно создал другой запрос.
+                continue
+
+
+def release(name):
+    '''Снимает ссылку на файл. True, если ссылок не осталось.
+
+    Строка с нулем ссылок остается до удаления файла: его удаление
+    и новая ссылка на тот же файл блокируют одну и ту же строку.
+    '''
+    with transaction.atomic():
+        StoredFile.objects.filter(name=name, references__gt=0).update(
+            references=F('references') - 1
+        )
+        references = StoredFile.objects.filter(name=name).values_list(
+            'references', flat=True
+        ).first()
+    return not references
+
+
+def references(name):
+    return StoredFile.objects.filter(name=name).values_list(
+        'references', flat=True
+    ).first() or 0
+
+
+class ContentAddressedMixin:
+    """Хранилище с адресацией по содержимому.
+
+    save() называет файл по SHA-256 содержимого: одинаковые загрузки
+    получают одно имя и хранятся один раз, а save() добавляет ссылку
+    на файл. delete() снимает ссылку, файл без ссылок удаляется после
+    коммита транзакции, чтобы откат не оставил ссылку без файла.
+    Файл под таким именем никогда не меняется.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(name, content)
+        validate_file_name(name, allow_relative_path=True)
+        if max_length is not None and len(name) > max_length:
+            raise SuspiciousFileOperation(
+                f'Имя файла {name} длиннее {max_length} символов.'
+            )
+        with transaction.atomic():
+            acquire(name)
+            if not self.exists(name):
+                saved = self._save(name, content)
+                if saved != name:
+                    # Тот же файл одновременно записал другой запрос.
+                    self._remove(saved)
+        return name
+
+    def delete(self, name):
+        if not name:
+            return
+        if release(name):
+            transaction.on_commit(lambda: self._remove_unreferenced(name))
+
+    def _remove_unreferenced(self, name):
+        if not is_content_name(name):
+            # Файл сохранен до хранилища по содержимому: он ни с кем
+            # не общий.
+            self._remove(name)
+            return
+        with transaction.atomic():
+            # DELETE блокирует строку, поэтому файл удаляется, только
+            # если ни одна транзакция не добавила к нему ссылку.
+            deleted, _ = StoredFile.objects.filter(
+                name=name, references=0
+            ).delete()
+            if deleted:
+                self._remove(name)
+
+    def _remove(self, name):
+        raise NotImplementedError
+
+    def cache_control(self, name):
+        '''Cache-Control для ответа с файлом'''
+        if is_content_name(name):
+            return IMMUTABLE_CACHE_CONTROL
+        return None
+
+
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+    """Хранилище по содержимому в MEDIA_ROOT."""
+
+    def _remove(self, name):
+        FileSystemStorage.delete(self, name)
+
+
+class S3ContentAddressedStorage(ContentAddressedMixin, Storage):
+    """Хранилище по содержимому в S3-совместимом бакете.
+
+    Клиент создается через boto3, если его не передали. Файлы
+    отдаются из бакета по base_url с заголовком Cache-Control,
+    сохраненным при загрузке.
+    """
+
+    def __init__(self, bucket=None, endpoint_url=None, base_url=None,
+                 client=None):
+        self.bucket = bucket or settings.MEDIA_S3_BUCKET
+        self.endpoint_url = endpoint_url or settings.MEDIA_S3_ENDPOINT_URL
+        self.base_url = base_url or settings.MEDIA_S3_BASE_URL or (
+            f'{self.endpoint_url}/{self.bucket}/'
+        )
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError as exc:
+                raise ImproperlyConfigured(
+                    'Для MEDIA_STORAGE=s3 установите boto3.'
+                ) from exc
+            self._client = boto3.client('s3', endpoint_url=self.endpoint_url)
+        return self._client
+
+    def _head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=name)
+        except Exception as error:
+            code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+            if code in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def _save(self, name, content):
+        content.seek(0)
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=name,
+            Body=content,
+            ContentType=(
+                mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            ),
+            CacheControl=self.cache_control(name) or 'no-cache',
+        )
+        return name
+
+    def _open(self, name, mode='rb'):
+        body = self.client.get_object(Bucket=self.bucket, Key=name)['Body']
+        return ContentFile(body.read(), name=name)
+
+    def _remove(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def size(self, name):
+        return self._head(name)['ContentLength']
+
+    def url(self, name):
+        return f'{self.base_url}{name}'
@@ -0,0 +1,57 @@
+# core/tests/test_cache.py
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+TIERED_CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'L1_TIMEOUT': 60,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-tests-shared',
+    },
+}
+
+
+@override_settings(CACHES=TIERED_CACHES)
+class TieredCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.shared = caches['shared']
+        self.cache.clear()
+
+    def test_value_reaches_shared_cache(self):
+        """Запись через двухуровневый кэш видна в общем кэше."""
+        self.cache.set('key', 'value')
+        self.assertEqual(self.shared.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    def test_local_copy_served_from_l1(self):
+        """Прочитанное значение кэшируется внутри процесса."""
+        self.shared.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.shared.delete('key')
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    def test_generations_bypass_l1(self):
+        """Счетчики поколений всегда читаются из общего кэша."""
+        self.cache.set('generation:feed:', 1)
+        self.shared.incr('generation:feed:')
+        self.assertEqual(self.cache.get('generation:feed:'), 2)
+        self.assertEqual(
+            self.cache.get_many(['generation:feed:']),
+            {'generation:feed:': 2}
+        )
+
+    def test_delete_and_incr_drop_local_copy(self):
+        """delete и incr убирают локальную копию."""
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter'), 2)
+        self.assertEqual(self.cache.get('counter'), 2)
+        self.cache.delete('counter')
+        self.assertIsNone(self.cache.get('counter'))
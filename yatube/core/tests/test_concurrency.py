@@ -0,0 +1,61 @@
+# core/tests/test_concurrency.py
+import threading
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+
+from ..concurrency import run_concurrently
+
+User = get_user_model()
+
+
+def usernames():
+    return threading.get_ident(), list(
+        User.objects.values_list('username', flat=True)
+    )
+
+
+class RunConcurrentlyTest(TransactionTestCase):
+
+    def test_threads(self):
+        """Вне транзакции функции выполняются в разных потоках
+        и видят зафиксированные данные."""
+        User.objects.create_user(username='test_user')
+        barrier = threading.Barrier(2, timeout=5)
+
+        def wait_other():
+            # Обе функции должны выполняться одновременно.
+            barrier.wait()
+            return usernames()
+
+        first, second = async_to_sync(run_concurrently)(wait_other, wait_other)
+        self.assertNotEqual(first[0], second[0])
+        self.assertEqual(first[1], ['test_user'])
+        self.assertEqual(second[1], ['test_user'])
+
+
+class RunSequentiallyTest(TestCase):
+
+    def test_atomic_block(self):
+        """В транзакции функции выполняются по очереди в потоке запроса."""
+        User.objects.create_user(username='test_user')
+        first, second = async_to_sync(run_concurrently)(usernames, usernames)
+        self.assertEqual(first, (threading.get_ident(), ['test_user']))
+        self.assertEqual(second, first)
+
+
+class LoadtestCommandTest(TestCase):
+
+    def test_both_handlers(self):
+        out = StringIO()
+        call_command(
+            'loadtest', '/about/author/',
+            requests=4, concurrency=2, stdout=out,
+        )
+        output = out.getvalue()
+        self.assertIn('WSGI /about/author/:', output)
+        self.assertIn('ASGI /about/author/:', output)
+        self.assertIn('ошибок 0', output)
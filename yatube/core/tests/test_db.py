@@ -0,0 +1,81 @@
+# core/tests/test_db.py
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import TestCase, override_settings
+
+
+class SqlitePragmasTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'test.sqlite3')
+        self.wrapper = DatabaseWrapper(
+            {**connection.settings_dict, 'NAME': self.path},
+            alias='pragmas',
+        )
+        self.addCleanup(self.wrapper.close)
+
+    def pragma(self, name):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_new_connection(self):
+        """Новое соединение получает WAL и остальные PRAGMA."""
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(
+            self.pragma('cache_size'),
+            settings.SQLITE_PRAGMAS['cache_size']
+        )
+        self.assertEqual(
+            self.pragma('busy_timeout'),
+            settings.SQLITE_PRAGMAS['busy_timeout']
+        )
+
+    def test_demo_database_keeps_journal(self):
+        """Файл базы из git не переводится в WAL."""
+        with override_settings(DEMO_DATABASE=self.path):
+            self.assertEqual(self.pragma('journal_mode'), 'delete')
+            self.assertEqual(self.pragma('synchronous'), 1)
+
+    def test_persistent_connections(self):
+        """Соединение переживает конец запроса: PRAGMA выполняются
+        один раз на соединение, а не на каждый запрос."""
+        created = []
+
+        def count(sender, connection, **kwargs):
+            if connection is self.wrapper:
+                created.append(connection.connection)
+
+        connection_created.connect(count)
+        self.addCleanup(connection_created.disconnect, count)
+        for _ in range(2):
+            # Так close_old_connections() проверяет соединение
+            # в начале и в конце каждого запроса.
+            self.wrapper.close_if_unusable_or_obsolete()
+            self.pragma('user_version')
+            self.wrapper.close_if_unusable_or_obsolete()
+        self.assertEqual(len(created), 1)
+
+
+class DbbenchCommandTest(TestCase):
+
+    def test_report(self):
+        out = StringIO()
+        call_command(
+            'dbbench', readers=1, writers=1, duration=0.2, stdout=out
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('default: чтений'))
+        self.assertTrue(lines[1].startswith('tuned: чтений'))
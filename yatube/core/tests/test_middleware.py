@@ -0,0 +1,51 @@
+# core/tests/test_middleware.py
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+
+TEMP_DUMP_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class ProfilingMiddlewareTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_DUMP_DIR, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        """Без выборки заголовок Server-Timing не добавляется."""
+        response = self.guest_client.get('/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_server_timing(self):
+        """Профилируемый запрос отдает Server-Timing и пишет лог."""
+        with self.assertLogs('yatube.profiling', 'INFO') as logs:
+            response = self.guest_client.get('/')
+        timing = response['Server-Timing']
+        for metric in ('total;dur=', 'db;dur=', 'tpl;dur=', 'cache;desc='):
+            with self.subTest(metric=metric):
+                self.assertIn(metric, timing)
+        self.assertIn('"queries":', logs.output[0])
+        self.assertNotIn('"queries": 0,', logs.output[0])
+
+    @override_settings(
+        PROFILING_SAMPLE_RATE=1,
+        PROFILING_SLOW_MS=0,
+        PROFILING_DUMP_DIR=TEMP_DUMP_DIR,
+    )
+    def test_slow_request_profile_dump(self):
+        """Для медленного запроса сохраняется дамп cProfile."""
+        with self.assertLogs('yatube.profiling', 'INFO'):
+            self.guest_client.get('/')
+        self.assertTrue(os.listdir(TEMP_DUMP_DIR))
@@ -0,0 +1,123 @@
+# core/tests/test_routers.py
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.routers import PRIMARY_COOKIE, ReplicaRouter, replicas_allowed
+from posts.cache import MODIFIED_KEY
+from posts.models import Post
+
+User = get_user_model()
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTest(TransactionTestCase):
+    # Копирование через backup API ждет конца открытой транзакции.
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        connections.settings['replica1'] = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(directory, 'replica1.sqlite3'),
+        }
+        self.addCleanup(self.remove_replica)
+        cache.clear()
+        self.user = User.objects.create_user(username='reader')
+        self.client.force_login(self.user)
+        self.old_post = Post.objects.create(author=self.user, text='Старый')
+        call_command('sync_replicas', stdout=StringIO())
+        self.new_post = Post.objects.create(author=self.user, text='Новый')
+
+    def remove_replica(self):
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+
+    def detail(self, post, client=None):
+        return (client or self.client).get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+
+    def profile(self, client, username='reader'):
+        return client.get(
+            reverse('posts:profile', kwargs={'username': username})
+        )
+
+    @override_settings(REPLICA_LAG=-1)
+    def test_feed_reads_replica(self):
+        """Страница из REPLICA_VIEWS читается с реплики."""
+        self.assertEqual(self.detail(self.old_post).status_code, 200)
+        self.assertEqual(self.detail(self.new_post).status_code, 404)
+        self.assertNotContains(self.profile(Client()), 'Новый')
+
+    def test_recent_write_reads_primary(self):
+        """Страница, в поколения которой только что писали, читается
+        с основной базы, остальные - с реплик."""
+        other = User.objects.create_user(username='other')
+        post = Post.objects.create(author=other, text='Чужой')
+        call_command('sync_replicas', stdout=StringIO())
+        Post.objects.filter(pk=post.pk).update(text='Правка')
+        # В поколения страницы автора other писали давно.
+        cache.set_many({
+            MODIFIED_KEY.format(scope='author', pk=other.pk): 0,
+            MODIFIED_KEY.format(scope='groups', pk=''): 0,
+            MODIFIED_KEY.format(scope='users', pk=''): 0,
+        }, None)
+        Post.objects.create(author=self.user, text='Свежий')
+        for client in (Client(), self.client):
+            with self.subTest(client=client):
+                self.assertContains(self.profile(client), 'Свежий')
+                self.assertContains(self.profile(client, 'other'), 'Чужой')
+
+    def test_write_pins_primary(self):
+        """После своей записи пользователь читает основную базу."""
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.old_post.pk}),
+            {'text': 'Комментарий'},
+        )
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        with self.settings(REPLICA_LAG=-1):
+            self.assertEqual(self.detail(self.new_post).status_code, 200)
+
+    def test_login_and_signup_pin_primary(self):
+        """Вход и регистрация тоже переводят чтение на основную базу."""
+        self.user.set_password('password')
+        self.user.save()
+        responses = (
+            Client().post(
+                reverse('users:login'),
+                {'username': 'reader', 'password': 'password'},
+            ),
+            Client().post(
+                reverse('users:signup'),
+                {
+                    'username': 'newcomer',
+                    'email': 'newcomer@example.com',
+                    'password1': 'Yatube-2024-password',
+                    'password2': 'Yatube-2024-password',
+                },
+            ),
+        )
+        for response in responses:
+            with self.subTest(url=response.url):
+                self.assertEqual(response.status_code, 302)
+                self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_primary_only_apps(self):
+        """Сессии и запросы вне middleware не читают реплики."""
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Post))
+        with replicas_allowed():
+            self.assertEqual(router.db_for_read(Post), 'replica1')
+            self.assertIsNone(router.db_for_read(Session))
+        self.assertFalse(router.allow_migrate('replica1', 'posts'))
@@ -0,0 +1,178 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.storage import (
+    IMMUTABLE_CACHE_CONTROL, S3ContentAddressedStorage, references
+)
+from posts.models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+class FakeClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+    '''Бакеты S3 в словаре: методы и ответы как у клиента boto3'''
+
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+
+    def put_object(self, Bucket, Key, Body, **params):
+        self.puts += 1
+        self.objects[Bucket, Key] = (Body.read(), params)
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeClientError('404')
+        body, params = self.objects[Bucket, Key]
+        return {'ContentLength': len(body), **params}
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeClientError('NoSuchKey')
+        return {'Body': ContentFile(self.objects[Bucket, Key][0])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_WORKERS=0)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_same_content_stored_once(self):
+        """Одинаковые файлы получают одно имя по SHA-256."""
+        first = default_storage.save('posts/a.gif', ContentFile(SMALL_GIF))
+        second = default_storage.save('posts/b.GIF', ContentFile(SMALL_GIF))
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^posts/(..)/(..)/\1\2[0-9a-f]{60}\.gif$')
+        self.assertEqual(references(first), 2)
+
+    def test_file_removed_with_last_reference(self):
+        """Файл удаляется после коммита, когда ссылок не осталось."""
+        name = default_storage.save('posts/a.gif', ContentFile(SMALL_GIF))
+        default_storage.save('posts/b.gif', ContentFile(SMALL_GIF))
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(name)
+        self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(name)
+        self.assertFalse(default_storage.exists(name))
+        self.assertEqual(references(name), 0)
+
+    def test_new_reference_keeps_file(self):
+        """Ссылка, добавленная до удаления файла без ссылок,
+        сохраняет файл."""
+        name = default_storage.save('posts/a.gif', ContentFile(SMALL_GIF))
+        with self.captureOnCommitCallbacks() as callbacks:
+            default_storage.delete(name)
+        self.assertEqual(references(name), 0)
+        default_storage.save('posts/b.gif', ContentFile(SMALL_GIF))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(references(name), 1)
+
+    def test_replaced_image_released(self):
+        """Замена картинки в post_edit удаляет старый файл, общий
+        с другим постом файл остается."""
+        user = User.objects.create_user(username='author')
+        post = Post.objects.create(
+            author=user,
+            text='Пост',
+            image=SimpleUploadedFile('a.gif', SMALL_GIF, 'image/gif'),
+        )
+        twin = Post.objects.create(
+            author=user,
+            text='Копия',
+            image=SimpleUploadedFile('b.gif', SMALL_GIF, 'image/gif'),
+        )
+        self.assertEqual(post.image.name, twin.image.name)
+        name = post.image.name
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+                {
+                    'text': 'Пост',
+                    'image': SimpleUploadedFile(
+                        'c.gif', SMALL_GIF + b'\x00', 'image/gif'
+                    ),
+                },
+            )
+        self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            twin.delete()
+        self.assertFalse(default_storage.exists(name))
+
+    @override_settings(MEDIA_SERVE=True)
+    def test_media_immutable(self):
+        """Файлы по содержимому отдаются с вечным Cache-Control."""
+        name = default_storage.save('posts/a.gif', ContentFile(SMALL_GIF))
+        response = self.client.get(default_storage.url(name))
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(b''.join(response.streaming_content), SMALL_GIF)
+
+    def test_media_not_served_by_default(self):
+        """Без DEBUG медиа отдает веб-сервер, а не Django."""
+        name = default_storage.save('posts/a.gif', ContentFile(SMALL_GIF))
+        response = self.client.get(default_storage.url(name))
+        self.assertEqual(response.status_code, 404)
+
+
+class S3StorageTest(TestCase):
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.storage = S3ContentAddressedStorage(
+            bucket='media',
+            endpoint_url='http://s3.test',
+            client=self.s3,
+        )
+
+    def test_save_deduplicates(self):
+        """Повторная загрузка в S3 только добавляет ссылку."""
+        name = self.storage.save('posts/a.gif', ContentFile(SMALL_GIF))
+        self.assertEqual(
+            self.storage.save('posts/b.gif', ContentFile(SMALL_GIF)), name
+        )
+        self.assertEqual(self.s3.puts, 1)
+        head = self.s3.head_object(Bucket='media', Key=name)
+        self.assertEqual(head['CacheControl'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(head['ContentType'], 'image/gif')
+        self.assertEqual(
+            self.storage.url(name), f'http://s3.test/media/{name}'
+        )
+        with self.storage.open(name) as source:
+            self.assertEqual(source.read(), SMALL_GIF)
+
+    def test_delete_last_reference(self):
+        """Объект удаляется из бакета с последней ссылкой."""
+        name = self.storage.save('posts/a.gif', ContentFile(SMALL_GIF))
+        self.storage.save('posts/b.gif', ContentFile(SMALL_GIF))
+        for exists in (True, False):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.storage.delete(name)
+            self.assertEqual(self.storage.exists(name), exists)
@@ -0,0 +1,82 @@
+# core/tests/test_uploads.py
+import struct
+import zlib
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.uploads import HeaderImageField
+from posts.models import Post, User
+
+
+def png_chunk(kind, data=b''):
+    return (
+        struct.pack('>I', len(data)) + kind + data
+        + struct.pack('>I', zlib.crc32(kind + data))
+    )
+
+
+def png_header(width, height):
+    '''PNG с заголовком и пустыми данными: размеры есть, пикселей нет'''
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + png_chunk(b'IHDR', ihdr)
+        + png_chunk(b'IDAT')
+        + png_chunk(b'IEND')
+    )
+
+
+class HeaderImageFieldTest(TestCase):
+
+    def clean(self, content, name='image.png'):
+        return HeaderImageField().clean(
+            SimpleUploadedFile(name, content, 'image/png')
+        )
+
+    def test_dimensions_from_header(self):
+        """Размеры читаются из заголовка без декодирования."""
+        upload = self.clean(png_header(640, 480))
+        self.assertEqual(upload.image.size, (640, 480))
+        self.assertEqual(upload.content_type, 'image/png')
+
+    def test_decompression_bomb(self):
+        """Огромные размеры при маленьком файле отклоняются."""
+        for size in ((8000, 8000), (30000, 30000)):
+            with self.subTest(size=size):
+                with self.assertRaisesMessage(Exception, 'мегапикселей'):
+                    self.clean(png_header(*size))
+
+    def test_not_an_image(self):
+        """Файл не картинка - ошибка формата."""
+        with self.assertRaisesMessage(Exception, 'Загрузите картинку'):
+            self.clean(b'not an image', 'image.txt')
+
+
+@override_settings(FILE_UPLOAD_MAX_SIZE=1000)
+class UploadLimitTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_oversize_upload_rejected(self):
+        """Файл больше FILE_UPLOAD_MAX_SIZE - ошибка формы."""
+        response = self.client.post(
+            reverse('posts:post_create'),
+            {
+                'text': 'Пост с большой картинкой',
+                'image': SimpleUploadedFile(
+                    'big.png', png_header(10, 10) + b'\0' * 5000, 'image/png'
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response.context['form'], 'image', 'Файл больше 1000\xa0байт'
+        )
+        self.assertFalse(Post.objects.exists())
@@ -0,0 +1,129 @@
+import warnings
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import (
+    StopUpload, TemporaryFileUploadHandler
+)
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+UPLOAD_ERROR = 'upload_error'
+
+
+def upload_error(request):
+    '''Причина, по которой загрузка файлов запроса была прервана'''
+    return getattr(request, UPLOAD_ERROR, None)
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет файлы во временный файл на диске пачками, без буфера
+    в памяти, и прерывает загрузку больше FILE_UPLOAD_MAX_SIZE.
+
+    Если заголовок Content-Length уже больше предела, загрузка
+    прерывается до первого байта файла. Иначе байты считаются по мере
+    получения: заголовок может быть занижен. Причина сохраняется
+    в request, форма показывает ее как ошибку поля.
+    """
+    too_big = False
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        self.too_big = content_length > settings.FILE_UPLOAD_MAX_SIZE
+
+    def reject(self):
+        setattr(self.request, UPLOAD_ERROR, (
+            f'Файл больше '
+            f'{filesizeformat(settings.FILE_UPLOAD_MAX_SIZE)}'
+        ))
+        # Остаток тела не читается: клиент получит разрыв соединения,
+        # если еще передает данные.
+        raise StopUpload(connection_reset=True)
+
+    def new_file(self, *args, **kwargs):
+        if self.too_big:
+            self.reject()
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.FILE_UPLOAD_MAX_SIZE:
+            self.reject()
+        return super().receive_data_chunk(raw_data, start)
+
+
+class HeaderImageField(forms.ImageField):
+    """ImageField, который читает только заголовок картинки.
+
+    Формат и размеры проверяются без декодирования пикселей: картинка
+    с огромными размерами при маленьком файле (decompression bomb)
+    отклоняется до того, как займет память. Пиксели декодирует только
+    posts.images.process_image, которая строит варианты и миниатюры:
+    при IMAGE_WORKERS > 0 - в пуле процессов, а не в веб-воркере.
+    """
+    default_error_messages = {
+        'invalid_image': 'Загрузите картинку в формате JPEG, PNG, GIF '
+                         'или WebP.',
+        'too_large': 'Картинка больше %(limit)s мегапикселей.',
+        'upload': '%(reason)s',
+    }
+
+    def __init__(self, *args, upload_error=None, **kwargs):
+        self.upload_error = upload_error
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        if self.upload_error:
+            raise ValidationError(
+                self.error_messages['upload'],
+                code='upload',
+                params={'reason': self.upload_error},
+            )
+        return super().clean(data, initial)
+
+    def to_python(self, data):
+        f = super(forms.ImageField, self).to_python(data)
+        if f is None:
+            return None
+        if hasattr(data, 'temporary_file_path'):
+            file = data.temporary_file_path()
+        else:
+            file = data
+        try:
+            with warnings.catch_warnings():
+                # Предупреждение Pillow о большой картинке - тоже отказ.
+                warnings.simplefilter('error', Image.DecompressionBombWarning)
+                # Открытый по пути файл закрывается сразу: пиксели
+                # не читаются.
+                with Image.open(file) as image:
+                    pass
+        except (Image.DecompressionBombWarning,
+                Image.DecompressionBombError) as exc:
+            raise self.too_large() from exc
+        except Exception as exc:
+            raise ValidationError(
+                self.error_messages['invalid_image'], code='invalid_image'
+            ) from exc
+        width, height = image.size
+        if image.format not in settings.IMAGE_UPLOAD_FORMATS:
+            raise ValidationError(
+                self.error_messages['invalid_image'], code='invalid_image'
+            )
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            raise self.too_large()
+        f.image = image
+        f.content_type = Image.MIME.get(image.format)
+        if hasattr(f, 'seek') and callable(f.seek):
+            f.seek(0)
+        return f
+
+    def too_large(self):
+        return ValidationError(
+            self.error_messages['too_large'],
+            code='too_large',
+            params={
+                'limit': settings.IMAGE_UPLOAD_MAX_PIXELS // 10 ** 6,
+            },
+        )
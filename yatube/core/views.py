@@ -1,4 +1,8 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import Http404
 from django.shortcuts import render
+from django.views.static import serve
 
 
 def page_not_found(request, exception):
@@ -11,3 +15,15 @@ def csrf_failure(request, reason=''):
 
 def forbidden(request, exception):
     return render(request, 'core/403.html', {'path': request.path}, status=403)
+
+
+def media(request, path):
+    """Отдает файл из MEDIA_ROOT при MEDIA_SERVE. Файлы, названные
+    по содержимому, браузер кэширует навсегда."""
+    if not settings.MEDIA_SERVE:
+        raise Http404
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    cache_control = getattr(default_storage, 'cache_control', None)
+    if cache_control and cache_control(path):
+        response['Cache-Control'] = cache_control(path)
+    return response
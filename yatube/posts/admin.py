@@ -1,9 +1,52 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max
+from django.utils.functional import cached_property
 
 from .models import Comment, Post, Group, Follow
+from .search import search_ids
 
 
-class PostAdmin(admin.ModelAdmin):
+class EstimatedCountPaginator(Paginator):
+    '''Paginator админки без COUNT(*) по всей таблице.
+
+    Для списка без фильтров количество берется из статистики SQLite
+    (sqlite_stat1, ее собирает ANALYZE), а без статистики оценивается
+    по наибольшему первичному ключу. Отфильтрованный список считается
+    как обычно.
+    '''
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if queryset.query.where or connection.vendor != 'sqlite':
+            return queryset.count()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT stat FROM sqlite_stat1 WHERE tbl = %s',
+                    [queryset.model._meta.db_table],
+                )
+                rows = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+        except DatabaseError:
+            # Таблицы sqlite_stat1 нет, пока не выполнен ANALYZE.
+            rows = []
+        if rows:
+            return max(rows)
+        return queryset.aggregate(last=Max('pk'))['last'] or 0
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    '''Настройки списка для больших таблиц'''
+    paginator = EstimatedCountPaginator
+    # Без второго COUNT(*) по всей таблице рядом с результатами фильтра.
+    show_full_result_count = False
+    empty_value_display = '-пусто-'
+
+
+class PostAdmin(ScalableAdmin):
     list_display = (
         'pk',
         'text',
@@ -12,12 +55,55 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    raw_id_fields = ('author',)
     search_fields = ('text',)
-    list_filter = ('pub_date',)
-    empty_value_display = '-пусто-'
+    date_hierarchy = 'pub_date'
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'group':
+            # Список групп читается один раз за запрос, а не для каждой
+            # строки list_editable: формы получают копии готового списка.
+            if not hasattr(request, 'group_choices'):
+                request.group_choices = list(iter(field.choices))
+            field.choices = request.group_choices
+        return field
+
+    def get_search_results(self, request, queryset, search_term):
+        '''Ищет по поисковому индексу вместо LIKE по тексту'''
+        if not search_term:
+            return queryset, False
+        found = [post_id for post_id, score in search_ids(search_term)]
+        return queryset.filter(pk__in=found), False
+
+
+class CommentAdmin(ScalableAdmin):
+    list_display = (
+        'pk',
+        'text',
+        'pub_date',
+        'author',
+        'post',
+    )
+    list_select_related = ('author', 'post')
+    raw_id_fields = ('post',)
+    autocomplete_fields = ('author',)
+    date_hierarchy = 'pub_date'
+    ordering = ('-pub_date', '-id')
+
+
+class FollowAdmin(ScalableAdmin):
+    list_display = (
+        'pk',
+        'user',
+        'author',
+    )
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
 
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
-admin.site.register(Comment)
-admin.site.register(Follow)
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(Follow, FollowAdmin)
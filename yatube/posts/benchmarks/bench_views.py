@@ -0,0 +1,182 @@
+# posts/benchmarks/bench_views.py
+"""Бенчмарк представлений posts на синтетических данных.
+
+Запуск:
+    pytest -m benchmark yatube/posts/benchmarks
+    python manage.py test posts.benchmarks -p "bench_*.py"
+
+Количество данных и прогонов задается переменными окружения
+BENCHMARK_POSTS, BENCHMARK_ROUNDS. BENCHMARK_UPDATE_BUDGETS=True
+перезаписывает budgets.json по результатам прогона с запасом.
+"""
+import json
+import logging
+import math
+import os
+import time
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+from posts.seeding import Seeder
+
+pytestmark = pytest.mark.benchmark
+logger = logging.getLogger('yatube.benchmark')
+
+BUDGETS_FILE = os.path.join(os.path.dirname(__file__), 'budgets.json')
+POSTS = int(os.getenv('BENCHMARK_POSTS', default='2000'))
+ROUNDS = int(os.getenv('BENCHMARK_ROUNDS', default='20'))
+UPDATE_BUDGETS = os.getenv('BENCHMARK_UPDATE_BUDGETS') == 'True'
+USERS = max(POSTS // 40, 10)
+GROUPS = 10
+COMMENTS = POSTS * 2
+FOLLOWS_PER_USER = 10
+# Запас при перезаписи бюджетов: время зависит от машины,
+# объем ответа и число запросов - нет, данные детерминированы seed.
+LATENCY_HEADROOM = 3
+BYTES_HEADROOM = 1.2
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+class ViewsBenchmark(TestCase):
+    '''Количество запросов, задержка и объем ответа представлений'''
+
+    @classmethod
+    def setUpTestData(cls):
+        Seeder(seed=0, batch_size=500).run(
+            users=USERS,
+            posts=POSTS,
+            comments=COMMENTS,
+            groups=GROUPS,
+            follows=FOLLOWS_PER_USER,
+        )
+        users = list(User.objects.order_by('id')[:2])
+        groups = list(Group.objects.order_by('id')[:1])
+        cls.user = users[0]
+        cls.author = users[1]
+        cls.group = groups[0]
+        cls.post = Post.objects.filter(comments_count__gt=0).first()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(BUDGETS_FILE, encoding='utf-8') as budgets:
+            cls.budgets = json.load(budgets)
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if UPDATE_BUDGETS and cls.results:
+            budgets = {
+                name: {
+                    'queries': result['queries'],
+                    'p95_ms': math.ceil(result['p95_ms'] * LATENCY_HEADROOM),
+                    'bytes': math.ceil(result['bytes'] * BYTES_HEADROOM),
+                }
+                for name, result in sorted(cls.results.items())
+            }
+            with open(BUDGETS_FILE, 'w', encoding='utf-8') as output:
+                json.dump(budgets, output, indent=4)
+                output.write('\n')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def measure(self, name, request):
+        '''Прогоняет запрос ROUNDS раз с холодным кэшем'''
+        timings = []
+        for _ in range(ROUNDS):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - started) * 1000)
+            self.assertLess(response.status_code, 400)
+        result = {
+            'queries': len(queries),
+            'p50_ms': percentile(timings, 0.5),
+            'p95_ms': percentile(timings, 0.95),
+            'bytes': len(response.content),
+        }
+        self.results[name] = result
+        logger.info(
+            '%-24s queries=%-4d p50=%.1fms p95=%.1fms bytes=%d',
+            name, result['queries'], result['p50_ms'], result['p95_ms'],
+            result['bytes'],
+        )
+        if UPDATE_BUDGETS:
+            return
+        budget = self.budgets[name]
+        self.assertLessEqual(result['queries'], budget['queries'], name)
+        self.assertLessEqual(result['p95_ms'], budget['p95_ms'], name)
+        self.assertLessEqual(result['bytes'], budget['bytes'], name)
+
+    def get(self, name, **kwargs):
+        url = reverse(f'posts:{name}', kwargs=kwargs)
+        self.measure(name, lambda: self.client.get(url))
+
+    def test_index(self):
+        self.get('index')
+
+    def test_group_list(self):
+        self.get('group_list', slug=self.group.slug)
+
+    def test_profile(self):
+        self.get('profile', username=self.author.username)
+
+    def test_post_detail(self):
+        self.get('post_detail', post_id=self.post.id)
+
+    def test_post_comments(self):
+        self.get('post_comments', post_id=self.post.id)
+
+    def test_post_create(self):
+        self.get('post_create')
+
+    def test_post_edit(self):
+        post = Post.objects.filter(author=self.user).first()
+        self.get('post_edit', post_id=post.id)
+
+    def test_follow_index(self):
+        self.get('follow_index')
+
+    def test_search(self):
+        # Слово из текста поста: выдача не пустая, данные детерминированы.
+        url = reverse('posts:search')
+        query = self.post.text.split()[0]
+        self.measure('search', lambda: self.client.get(url, {'q': query}))
+
+    def test_add_comment(self):
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.id})
+        self.measure(
+            'add_comment',
+            lambda: self.client.post(url, {'text': 'Комментарий'})
+        )
+
+    def test_profile_follow(self):
+        url = reverse('posts:profile_follow',
+                      kwargs={'username': self.author.username})
+        self.measure('profile_follow', lambda: self.client.get(url))
+
+    def test_profile_unfollow(self):
+        follow = reverse('posts:profile_follow',
+                         kwargs={'username': self.author.username})
+        unfollow = reverse('posts:profile_unfollow',
+                           kwargs={'username': self.author.username})
+
+        def request():
+            self.client.get(follow)
+            return self.client.get(unfollow)
+        self.measure('profile_unfollow', request)
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import secrets
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from core.routers import replicas_allowed
+
+GENERATION_KEY = 'generation:{scope}:{pk}'
+MODIFIED_KEY = 'modified:{scope}:{pk}'
+PAGE_KEY = 'page:{path}:{version}'
+# Названия групп и имена авторов выводятся во всех лентах: их правка
+# инвалидирует все фрагменты.
+SHARED_SCOPES = (('groups',), ('users',))
+
+
+def _generation_key(scope, pk=''):
+    return GENERATION_KEY.format(scope=scope, pk=pk)
+
+
+def _modified_key(scope, pk=''):
+    return MODIFIED_KEY.format(scope=scope, pk=pk)
+
+
+def _generation():
+    '''Новое поколение: время в наносекундах и случайный суффикс.
+
+    incr не атомарен в файловом кэше, и две инвалидации могли дать
+    одно значение. Новое значение всегда уникально, в том числе после
+    вытеснения поколения из кэша.
+    '''
+    return f'{time.time_ns():x}{secrets.token_hex(4)}'
+
+
+def get_generations(*scopes):
+    '''Текущие поколения для пар (scope, pk)'''
+    keys = [_generation_key(*scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def cache_version(*scopes):
+    '''Версия содержимого для ключа кэша фрагмента или страницы'''
+    generations = get_generations(*scopes, *SHARED_SCOPES)
+    return '.'.join(str(generation) for generation in generations)
+
+
+def bump(*scopes):
+    '''Инвалидирует все ключи, построенные на этих поколениях'''
+    now = int(time.time())
+    cache.set_many({
+        **{_generation_key(*scope): _generation() for scope in scopes},
+        **{_modified_key(*scope): now for scope in scopes},
+    }, None)
+
+
+def last_modified(*scopes):
+    '''Время последней записи, затронувшей эти поколения'''
+    keys = [_modified_key(*scope) for scope in (*scopes, *SHARED_SCOPES)]
+    modified = cache.get_many(keys)
+    if len(modified) < len(keys):
+        # Время вытеснено из кэша: считаем, что запись была сейчас.
+        now = int(time.time())
+        for key in keys:
+            if key not in modified:
+                cache.add(key, now, None)
+                modified[key] = cache.get(key, now)
+    return max(modified.values())
+
+
+def _reads(modified):
+    if (not settings.REPLICA_DATABASES
+            or time.time() - modified > settings.REPLICA_LAG):
+        return nullcontext()
+    return replicas_allowed(False)
+
+
+def fresh_reads(*scopes):
+    '''Контекст для чтения страницы с этими поколениями.
+
+    Если в них писали меньше REPLICA_LAG секунд назад, реплика может
+    еще не видеть запись, и страница читается с основной базы: иначе
+    устаревшая копия попала бы в кэш под новой версией.
+    '''
+    if not settings.REPLICA_DATABASES:
+        return nullcontext()
+    return _reads(last_modified(*scopes))
+
+
+def post_scopes(post):
+    '''Поколения, от которых зависит отображение поста'''
+    scopes = [('feed',), ('author', post.author_id), ('post', post.pk)]
+    if post.group_id:
+        scopes.append(('group', post.group_id))
+    return scopes
+
+
+def _page(request, get_scopes, args, kwargs):
+    '''Ключ кэша, ETag и Last-Modified страницы или None, если
+    страница не зависит от поколений. Для пользователя, которому
+    страницу не кэшируют, ключ и ETag - None'''
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    anonymous = not request.user.is_authenticated
+    if not anonymous and not settings.REPLICA_DATABASES:
+        return None
+    scopes = get_scopes(*args, **kwargs)
+    if scopes is None:
+        return None
+    if not anonymous:
+        # Только для выбора базы: страница не кэшируется.
+        return None, None, last_modified(*scopes)
+    path = request.get_full_path()
+    version = cache_version(*scopes)
+    etag = quote_etag(hashlib.md5(f'{path}|{version}'.encode()).hexdigest())
+    key = PAGE_KEY.format(
+        path=hashlib.md5(path.encode()).hexdigest(),
+        version=version,
+    )
+    return key, etag, last_modified(*scopes)
+
+
+def _cached_response(request, page):
+    key, etag, modified = page
+    if key is None:
+        return None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=modified
+    )
+    if response is None:
+        response = cache.get(key)
+    return response
+
+
+def _store_response(request, response, page):
+    '''Сохраняет ответ представления, возвращает False,
+    если ответ кэшировать нельзя'''
+    # get_token() ставит CSRF_COOKIE_NEEDS_UPDATE, а cookie добавляет
+    # CsrfViewMiddleware уже после представления: в response.cookies
+    # его еще нет.
+    if (page[0] is None
+            or response.status_code != 200
+            or response.cookies
+            or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')):
+        return False
+    cache.set(page[0], response, settings.PAGE_CACHE_TIMEOUT)
+    return True
+
+
+def _set_validators(response, page):
+    key, etag, modified = page
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    return response
+
+
+def cache_anonymous_page(get_scopes):
+    '''Кэширует страницы целиком для анонимных пользователей.
+
+    get_scopes(*args, **kwargs) возвращает поколения, от которых зависит
+    страница, или None, если страницу кэшировать нельзя. Ключ кэша - путь
+    с параметрами и версия поколений. Та же версия дает сильный ETag,
+    а время последней записи - Last-Modified, поэтому повторный запрос
+    с If-None-Match получает 304 без вызова представления.
+    Ответы, которые ставят cookie или используют CSRF-токен, не кэшируются.
+    Страница, в поколения которой недавно писали, читается с основной
+    базы, а не с реплик (см. fresh_reads).
+    Подходит и для асинхронных представлений: обращения к кэшу и сессии
+    тогда выполняются через sync_to_async.
+    '''
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                page = await sync_to_async(_page)(
+                    request, get_scopes, args, kwargs
+                )
+                if page is None:
+                    return await view(request, *args, **kwargs)
+                response = await sync_to_async(_cached_response)(
+                    request, page
+                )
+                if response is None:
+                    with _reads(page[2]):
+                        response = await view(request, *args, **kwargs)
+                    stored = await sync_to_async(_store_response)(
+                        request, response, page
+                    )
+                    if not stored:
+                        return response
+                return _set_validators(response, page)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            page = _page(request, get_scopes, args, kwargs)
+            if page is None:
+                return view(request, *args, **kwargs)
+            response = _cached_response(request, page)
+            if response is None:
+                with _reads(page[2]):
+                    response = view(request, *args, **kwargs)
+                if not _store_response(request, response, page):
+                    return response
+            return _set_validators(response, page)
+        return wrapper
+    return decorator
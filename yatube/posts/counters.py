@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import timeline
+from .models import AuthorStats, Follow, Post, User
+
+
+def _create_stats(author_id):
+    # Строки еще нет: считаем один раз, дальше только F()-обновления.
+    AuthorStats.objects.get_or_create(
+        user_id=author_id,
+        defaults={
+            'posts_count': Post.objects.filter(author_id=author_id).count(),
+            'followers_count': Follow.objects.filter(
+                author_id=author_id
+            ).count(),
+        },
+    )
+
+
+def change_posts_count(author_id, delta):
+    '''Атомарно меняет счетчик постов автора'''
+    updated = AuthorStats.objects.filter(user_id=author_id).update(
+        posts_count=F('posts_count') + delta
+    )
+    if not updated and delta > 0:
+        _create_stats(author_id)
+
+
+def change_followers_count(author_id, delta):
+    '''Атомарно меняет счетчик подписчиков автора и, если он перешел
+    TIMELINE_FANOUT_LIMIT, статус знаменитости'''
+    updated = AuthorStats.objects.filter(user_id=author_id).update(
+        followers_count=F('followers_count') + delta,
+        # Переход порога вверх отмечается тем же запросом.
+        celebrity_since=Case(
+            When(
+                celebrity_since__isnull=True,
+                followers_count__gt=settings.TIMELINE_FANOUT_LIMIT - delta,
+                then=Value(timezone.now()),
+            ),
+            default=F('celebrity_since'),
+        ),
+    )
+    if not updated and delta > 0:
+        _create_stats(author_id)
+        timeline.update_celebrity(author_id)
+    elif delta < 0:
+        timeline.update_celebrity(author_id)
+
+
+def change_comments_count(post_id, delta):
+    '''Атомарно меняет счетчик комментариев поста'''
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta
+    )
+
+
+def _batches(items, size=500):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reconcile():
+    '''Исправляет расхождения счетчиков с данными.
+
+    Возвращает количество исправленных постов и авторов.
+    '''
+    fixed_posts = 0
+    # Расхождения собираются до записи: читать таблицу курсором
+    # и одновременно обновлять ее в SQLite небезопасно.
+    drifted_posts = list(
+        Post.objects.order_by().annotate(actual=Count('comments'))
+        .exclude(comments_count=F('actual'))
+        .only('id')
+    )
+    for batch in _batches(drifted_posts):
+        for post in batch:
+            post.comments_count = post.actual
+        Post.objects.bulk_update(batch, ['comments_count'])
+        fixed_posts += len(batch)
+
+    fixed_authors = 0
+    posts_count = Post.objects.filter(
+        author=OuterRef('pk')
+    ).order_by().values('author').annotate(total=Count('id')).values('total')
+    followers_count = Follow.objects.filter(
+        author=OuterRef('pk')
+    ).order_by().values('author').annotate(total=Count('id')).values('total')
+    authors = User.objects.annotate(
+        actual_posts=Coalesce(Subquery(posts_count), 0),
+        actual_followers=Coalesce(Subquery(followers_count), 0),
+    ).values_list(
+        'pk', 'actual_posts', 'actual_followers',
+        'stats__posts_count', 'stats__followers_count',
+        'stats__celebrity_since',
+    )
+    drifted_stats = [
+        AuthorStats(user_id=pk, posts_count=posts, followers_count=followers,
+                    celebrity_since=since)
+        for pk, posts, followers, current_posts, current_followers, since
+        in authors.iterator()
+        if (current_posts, current_followers) != (posts, followers)
+        and (current_posts is not None or posts or followers)
+    ]
+    for batch in _batches(drifted_stats):
+        AuthorStats.objects.filter(
+            user_id__in=[stats.user_id for stats in batch]
+        ).delete()
+        AuthorStats.objects.bulk_create(batch)
+        fixed_authors += len(batch)
+    # Исправленный счетчик подписчиков мог перейти порог знаменитости.
+    for stats in drifted_stats:
+        timeline.update_celebrity(stats.user_id)
+    return fixed_posts, fixed_authors
@@ -1,13 +1,20 @@
 from django import forms
 
+from core.uploads import HeaderImageField
+
 from .models import Comment, Post
 
 
 class PostForm(forms.ModelForm):
 
+    def __init__(self, *args, upload_error=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['image'].upload_error = upload_error
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
+        field_classes = {'image': HeaderImageField}
 
 
 class CommentForm(forms.ModelForm):
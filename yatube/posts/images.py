@@ -0,0 +1,192 @@
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from . import cache as versions
+from .models import IMAGE_DIRECTORY, Post
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIRECTORY = f'{IMAGE_DIRECTORY}variants/'
+THUMBNAILS_DIRECTORY = f'{IMAGE_DIRECTORY}thumbnails/'
+# Формат -> параметры Pillow. WebP для браузеров, которые его
+# понимают, JPEG - для остальных.
+FORMATS = {
+    'webp': ('WEBP', {'method': 4}),
+    'jpeg': ('JPEG', {'optimize': True, 'progressive': True}),
+}
+# Ширина картинки в ленте: ее вариант попадает в src.
+FEED_WIDTH = 960
+# Поле модели -> размер миниатюры и точка кадрирования в долях ширины
+# и высоты: '30% top' и 'center', как их раньше строил sorl.
+THUMBNAILS = {
+    'thumbnail_feed': ((960, 339), (0.3, 0.0)),
+    'thumbnail_detail': ((960, 339), (0.5, 0.5)),
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # spawn, а не fork: потомок не должен унаследовать открытое
+        # соединение с базой от потока запроса.
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+    return _executor
+
+
+def _encode(image, image_format, **options):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA')
+    out = io.BytesIO()
+    # Без exif= Pillow не переносит метаданные в новый файл.
+    image.save(out, image_format, **options)
+    return out.getvalue()
+
+
+def _widths(width):
+    widths = [w for w in settings.IMAGE_VARIANT_WIDTHS if w < width]
+    return widths or [width]
+
+
+def process_image(name):
+    '''Декодирует картинку один раз и сохраняет варианты.
+
+    Выполняется в пуле процессов со своими соединениями с базой:
+    хранилище записывает в нее ссылки на сохраненные файлы (StoredFile),
+    а строку поста и кэш обновляет основной процесс. Возвращает
+    новое имя оригинала (None, если оригинал не менялся) и описание
+    вариантов для Post.variants вместе с адресами миниатюр.
+    '''
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        # is_animated перебирает кадры: файл еще должен быть открыт.
+        animated = getattr(image, 'is_animated', False)
+        image.load()
+    image_format = image.format
+    has_exif = bool(image.getexif())
+    # Поворот из EXIF применяется к пикселям до удаления EXIF.
+    image = ImageOps.exif_transpose(image)
+    limit = settings.IMAGE_MAX_SIDE
+    original = None
+    if not animated and (has_exif or max(image.size) > limit):
+        image.thumbnail((limit, limit), Image.LANCZOS)
+        original = default_storage.save(
+            name,
+            ContentFile(_encode(
+                image, image_format, quality=settings.IMAGE_QUALITY['jpeg']
+            )),
+        )
+    stem = os.path.splitext(os.path.basename(original or name))[0]
+    srcsets = {extension: [] for extension in FORMATS}
+    files = []
+    src = None
+    for width in _widths(image.width):
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        for extension, (pil_format, options) in FORMATS.items():
+            variant = default_storage.save(
+                f'{VARIANTS_DIRECTORY}{stem}-{width}.{extension}',
+                ContentFile(_encode(
+                    resized,
+                    pil_format,
+                    quality=settings.IMAGE_QUALITY[extension],
+                    **options,
+                )),
+            )
+            files.append(variant)
+            url = default_storage.url(variant)
+            srcsets[extension].append(f'{url} {width}w')
+            if extension == 'jpeg' and (src is None or width <= FEED_WIDTH):
+                src = {'src': url, 'width': width, 'height': height}
+    thumbnails = {}
+    for field, (size, centering) in THUMBNAILS.items():
+        thumbnail = default_storage.save(
+            f'{THUMBNAILS_DIRECTORY}{stem}-{field}.jpg',
+            ContentFile(_encode(
+                ImageOps.fit(image, size, Image.LANCZOS, centering=centering),
+                'JPEG',
+                quality=settings.IMAGE_QUALITY['jpeg'],
+                **FORMATS['jpeg'][1],
+            )),
+        )
+        files.append(thumbnail)
+        thumbnails[field] = default_storage.url(thumbnail)
+    variants = {extension: ', '.join(srcset)
+                for extension, srcset in srcsets.items()}
+    variants.update(src, files=files, thumbnails=thumbnails)
+    return original, variants
+
+
+def apply_variants(post_id, name, original, variants):
+    '''Сохраняет варианты в строке поста, если картинку не заменили,
+    пока она обрабатывалась'''
+    fields = {'variants': variants, **variants['thumbnails']}
+    if original:
+        fields['image'] = original
+    current = Post.objects.filter(pk=post_id, image=name)
+    with transaction.atomic():
+        previous = current.select_for_update().values_list(
+            'variants', flat=True
+        ).first()
+        updated = previous is not None and current.update(**fields)
+    if not updated:
+        for variant in variants['files']:
+            default_storage.delete(variant)
+        if original:
+            default_storage.delete(original)
+        return
+    # Прежние варианты той же картинки: при перестройке имена
+    # совпадают, и без этого ссылки на файлы только копились бы.
+    for variant in previous.get('files', ()):
+        default_storage.delete(variant)
+    if original:
+        default_storage.delete(name)
+    post = Post.objects.only('id', 'author_id', 'group_id').get(pk=post_id)
+    versions.bump(*versions.post_scopes(post))
+
+
+def _apply_result(post_id, name, future):
+    try:
+        apply_variants(post_id, name, *future.result())
+    except Exception:
+        logger.exception('Не удалось обработать картинку поста %s', post_id)
+    finally:
+        close_old_connections()
+
+
+def _submit(post_id, name):
+    future = get_executor().submit(process_image, name)
+    future.add_done_callback(
+        lambda future: _apply_result(post_id, name, future)
+    )
+
+
+def schedule_variants(post):
+    '''Ставит обработку картинки в пул процессов после коммита.
+
+    При IMAGE_WORKERS = 0 картинка обрабатывается сразу, в запросе.
+    '''
+    if not post.image:
+        return
+    name = post.image.name
+    if not settings.IMAGE_WORKERS:
+        apply_variants(post.pk, name, *process_image(name))
+        return
+    transaction.on_commit(lambda: _submit(post.pk, name))
@@ -0,0 +1,39 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.outbox import drain, get_outbox
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит комментарии и подписки из очереди отложенной записи '
+        'в базу. Без --once работает, пока не будет остановлен'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Перенести все, что есть в очереди, и выйти',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE,
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='Только вывести глубину очереди и скорость переноса',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(get_outbox().stats()))
+            return
+        while True:
+            if drain(options['batch_size']):
+                continue
+            if options['once']:
+                break
+            time.sleep(settings.OUTBOX_DRAIN_INTERVAL)
+        self.stdout.write(json.dumps(get_outbox().stats()))
@@ -0,0 +1,50 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts.transfer import MODELS, Progress, write_csv, write_jsonl
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии и подписки в JSON Lines '
+        '(один файл) или CSV (каталог с файлом на модель)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл .jsonl (- для stdout) или каталог для CSV',
+        )
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'), default='jsonl',
+        )
+        parser.add_argument(
+            '--models', nargs='+', choices=MODELS, default=MODELS,
+            help='Выгружаемые модели, по умолчанию все',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Строк за один запрос к базе',
+        )
+        parser.add_argument(
+            '--media-dir',
+            help='Скопировать картинки постов в этот каталог',
+        )
+
+    def handle(self, *args, **options):
+        models = [model for model in MODELS if model in options['models']]
+        progress = Progress(self.stderr)
+        arguments = (
+            models, options['batch_size'], progress, options['media_dir']
+        )
+        if options['format'] == 'csv':
+            write_csv(options['path'], *arguments)
+        elif options['path'] == '-':
+            write_jsonl(sys.stdout, *arguments)
+        else:
+            with open(options['path'], 'w', encoding='utf-8') as stream:
+                write_jsonl(stream, *arguments)
+        for model in models:
+            self.stderr.write(progress.line(model))
+        self.stderr.write(progress.summary())
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.images import apply_variants, process_image
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры для постов, у которых их еще нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить миниатюры всех постов с картинками',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.filter(thumbnail_feed='')
+        done = 0
+        for post_id, name in posts.values_list('id', 'image').iterator():
+            # Миниатюры строятся вместе с вариантами, из одного декода.
+            apply_variants(post_id, name, *process_image(name))
+            done += 1
+        self.stdout.write(f'Миниатюры построены для {done} постов')
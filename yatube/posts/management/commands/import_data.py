@@ -0,0 +1,63 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.transfer import Importer, Progress, read_csv, read_jsonl
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает группы, посты, комментарии и подписки из JSON Lines '
+        'или CSV, выгруженных командой export_data'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл .jsonl (- для stdin) или каталог с CSV',
+        )
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'), default='jsonl',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Строк в одном bulk_create',
+        )
+        parser.add_argument(
+            '--media-dir',
+            help='Каталог с картинками постов, они копируются в хранилище',
+        )
+
+    def handle(self, *args, **options):
+        progress = Progress(self.stderr)
+        importer = Importer(
+            options['batch_size'], options['media_dir'], progress
+        )
+        with transaction.atomic():
+            if options['format'] == 'csv':
+                self.load(importer, read_csv(options['path']))
+            elif options['path'] == '-':
+                self.load(importer, read_jsonl(sys.stdin))
+            else:
+                with open(options['path'], encoding='utf-8') as stream:
+                    self.load(importer, read_jsonl(stream))
+        self.stderr.write(progress.summary())
+        self.stdout.write(
+            'Создано: ' + ', '.join(
+                f'{model} {count}'
+                for model, count in importer.created.items()
+            )
+        )
+        if importer.skipped:
+            self.stdout.write(
+                'Пропущено: ' + ', '.join(
+                    f'{model} {count}'
+                    for model, count in importer.skipped.items()
+                )
+            )
+
+    def load(self, importer, records):
+        for model, record in records:
+            importer.add(model, record)
+        importer.finish()
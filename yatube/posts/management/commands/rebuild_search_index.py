@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import get_index, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс постов'
+
+    def handle(self, *args, **options):
+        total = rebuild()
+        self.stdout.write(
+            f'Проиндексировано постов: {total} '
+            f'({type(get_index()).__name__})'
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счетчики постов и комментариев с данными'
+
+    def handle(self, *args, **options):
+        fixed_posts, fixed_authors = reconcile()
+        self.stdout.write(
+            f'Исправлено счетчиков комментариев: {fixed_posts}, '
+            f'счетчиков постов: {fixed_authors}'
+        )
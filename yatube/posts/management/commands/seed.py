@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу синтетическими пользователями, постами, '
+        'комментариями и подписками. Одинаковый --seed дает одинаковые '
+        'данные при любом числе процессов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Строк в пачке генерации и bulk_create',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=0,
+            help='Процессов для генерации строк, 0 - без пула',
+        )
+        parser.add_argument(
+            '--password', default='password',
+            help='Пароль всех созданных пользователей',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 and (options['posts'] or options['comments']):
+            raise CommandError('Для постов нужен хотя бы один пользователь')
+        if options['posts'] < 1 and options['comments']:
+            raise CommandError('Для комментариев нужен хотя бы один пост')
+        seeder = Seeder(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            password=options['password'],
+            stream=self.stderr,
+        )
+        with transaction.atomic():
+            summary = seeder.run(
+                users=options['users'],
+                posts=options['posts'],
+                comments=options['comments'],
+                groups=options['groups'],
+                follows=options['follows'],
+            )
+        for model in ('group', 'user', 'post', 'comment', 'follow'):
+            self.stderr.write(seeder.progress.line(model))
+        self.stdout.write(summary)
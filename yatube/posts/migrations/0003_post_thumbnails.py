@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-17 20:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnail_detail',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Миниатюра для страницы поста'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='thumbnail_feed',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Миниатюра для ленты'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 21:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_comment_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='srcset для WebP и JPEG и картинка для src', verbose_name='Варианты картинки'),
+        ),
+    ]
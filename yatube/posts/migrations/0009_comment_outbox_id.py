@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 21:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_post_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='outbox_id',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, help_text='Строка очереди отложенной записи, из которой создан комментарий', null=True, unique=True, verbose_name='Строка очереди'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.16 on 2026-10-17 22:06
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.utils import timezone
+
+
+def fill_followers(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    rows = Follow.objects.order_by().values('author').annotate(
+        total=Count('id')
+    )
+    for row in rows.iterator():
+        stats, _ = AuthorStats.objects.get_or_create(user_id=row['author'])
+        stats.followers_count = row['total']
+        if row['total'] > settings.TIMELINE_FANOUT_LIMIT:
+            # Посты знаменитостей раньше не попадали в ленты вовсе.
+            stats.celebrity_since = Post.objects.filter(
+                author_id=row['author']
+            ).aggregate(first=Min('pub_date'))['first'] or timezone.now()
+        stats.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_comment_outbox_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='celebrity_since',
+            field=models.DateTimeField(blank=True, help_text='Когда подписчиков стало больше TIMELINE_FANOUT_LIMIT: с этого момента посты не раздаются по лентам', null=True, verbose_name='Знаменитость с'),
+        ),
+        migrations.AddField(
+            model_name='authorstats',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество подписчиков'),
+        ),
+        migrations.RunPython(fill_followers, migrations.RunPython.noop),
+    ]
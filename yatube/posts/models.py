@@ -48,14 +48,52 @@ class Post(CreatedModel):
         blank=True,
         help_text='Приложите вашу лучшую фотографию'
     )
+    thumbnail_feed = models.CharField(
+        'Миниатюра для ленты',
+        max_length=255,
+        blank=True,
+        editable=False,
+    )
+    thumbnail_detail = models.CharField(
+        'Миниатюра для страницы поста',
+        max_length=255,
+        blank=True,
+        editable=False,
+    )
+    variants = models.JSONField(
+        'Варианты картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text='srcset для WebP и JPEG и картинка для src',
+    )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False,
+    )
 
     def __str__(self) -> str:
         return self.text[:15]
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='post_date_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='post_author_date_idx',
+            ),
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='post_group_date_idx',
+            ),
+        )
 
 
 class Comment(CreatedModel):
@@ -75,11 +113,30 @@ class Comment(CreatedModel):
         related_name='comments',
         verbose_name='Комментируемый пост'
     )
+    outbox_id = models.PositiveBigIntegerField(
+        'Строка очереди',
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        help_text='Строка очереди отложенной записи, из которой создан '
+                  'комментарий',
+    )
 
     class Meta:
-        ordering = ('pub_date',)
+        ordering = ('pub_date', 'id')
         verbose_name = 'Комментарии'
         verbose_name_plural = 'Комментарии'
+        indexes = (
+            models.Index(
+                fields=('post', 'pub_date', 'id'),
+                name='comment_post_date_idx',
+            ),
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='comment_date_idx',
+            ),
+        )
 
     def __str__(self) -> str:
         return self.text[:15]
@@ -101,3 +158,102 @@ class Follow(models.Model):
 
     class Meta:
         verbose_name = 'Подписки'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_follow',
+            ),
+        )
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счетчики автора."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор',
+    )
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+    )
+    celebrity_since = models.DateTimeField(
+        'Знаменитость с',
+        null=True,
+        blank=True,
+        help_text='Когда подписчиков стало больше TIMELINE_FANOUT_LIMIT: '
+                  'с этого момента посты не раздаются по лентам',
+    )
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self) -> str:
+        return f'{self.user}: {self.posts_count}'
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Владелец ленты',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField('Дата создания поста')
+
+    class Meta:
+        ordering = ('-pub_date', '-post_id')
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='unique_timeline_entry',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_date_idx',
+            ),
+        )
+
+
+class SearchTerm(models.Model):
+    """Вхождение основы слова в пост: запасной поисковый индекс,
+    если SQLite собран без FTS5."""
+    term = models.CharField('Основа слова', max_length=64)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+        verbose_name='Пост',
+    )
+    frequency = models.PositiveIntegerField('Число вхождений', default=1)
+
+    class Meta:
+        verbose_name = 'Поисковый терм'
+        verbose_name_plural = 'Поисковый индекс'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('term', 'post'),
+                name='unique_search_term',
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.term}: {self.post_id}'
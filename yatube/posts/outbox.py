@@ -0,0 +1,327 @@
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+from django.db.models import Q
+
+from core.models import keep_dates
+
+from . import cache as versions
+from . import counters, timeline
+from .models import Comment, Follow, Post, User
+
+logger = logging.getLogger('yatube.outbox')
+
+COMMENT = 'comment'
+FOLLOW = 'follow'
+UNFOLLOW = 'unfollow'
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS outbox ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+    'kind TEXT NOT NULL, '
+    'user_id INTEGER NOT NULL, '
+    'target_id INTEGER NOT NULL, '
+    'text TEXT, '
+    'created REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS outbox_user '
+    'ON outbox (user_id, target_id)',
+    'CREATE TABLE IF NOT EXISTS outbox_stats ('
+    'id INTEGER PRIMARY KEY CHECK (id = 1), '
+    'drained INTEGER NOT NULL, '
+    'batches INTEGER NOT NULL, '
+    'seconds REAL NOT NULL, '
+    'last_drain REAL)',
+    'INSERT OR IGNORE INTO outbox_stats VALUES (1, 0, 0, 0, NULL)',
+    'CREATE TABLE IF NOT EXISTS outbox_failed ('
+    'id INTEGER PRIMARY KEY, '
+    'kind TEXT NOT NULL, '
+    'user_id INTEGER NOT NULL, '
+    'target_id INTEGER NOT NULL, '
+    'text TEXT, '
+    'created REAL NOT NULL, '
+    'error TEXT NOT NULL)',
+)
+
+
+class Outbox:
+    """Очередь записей в отдельном файле SQLite.
+
+    Запросы не ждут блокировку записи основной базы: вставка строки
+    в очередь короткая, а в базу записи переносит drain() пачками.
+    Строка удаляется из очереди после коммита пачки в базу. При сбое
+    между ними пачка переносится повторно: комментарий хранит id своей
+    строки и второй раз не создается, а подписки идемпотентны.
+    Строки, которые база отвергла, откладываются в outbox_failed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    @property
+    def db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=20,
+                                 isolation_level=None)
+            db.execute('PRAGMA journal_mode = wal')
+            # Очередь - единственная копия записи до переноса в базу.
+            db.execute('PRAGMA synchronous = full')
+            with db:
+                for sql in SCHEMA:
+                    db.execute(sql)
+            self.local.db = db
+        return db
+
+    def close(self):
+        db = getattr(self.local, 'db', None)
+        if db is not None:
+            db.close()
+            self.local.db = None
+
+    def put(self, kind, user_id, target_id, text=None):
+        self.db.execute(
+            'INSERT INTO outbox (kind, user_id, target_id, text, created) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (kind, user_id, target_id, text, time.time()),
+        )
+
+    def pending(self, user_id, target_id, *kinds):
+        '''Еще не перенесенные записи пользователя'''
+        marks = ', '.join('?' * len(kinds))
+        return self.db.execute(
+            f'SELECT kind, text, created FROM outbox '
+            f'WHERE user_id = ? AND target_id = ? AND kind IN ({marks}) '
+            f'ORDER BY id',
+            (user_id, target_id, *kinds),
+        ).fetchall()
+
+    def take(self, limit):
+        return self.db.execute(
+            'SELECT id, kind, user_id, target_id, text, created '
+            'FROM outbox ORDER BY id LIMIT ?',
+            (limit,),
+        ).fetchall()
+
+    def ack(self, last_id, rows, seconds, failed=()):
+        '''Удаляет перенесенные строки, откладывает строки failed
+        с текстом ошибки и обновляет статистику'''
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            self.db.executemany(
+                'INSERT OR REPLACE INTO outbox_failed '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                failed,
+            )
+            self.db.execute('DELETE FROM outbox WHERE id <= ?', (last_id,))
+            self.db.execute(
+                'UPDATE outbox_stats SET drained = drained + ?, '
+                'batches = batches + 1, seconds = seconds + ?, '
+                'last_drain = ? WHERE id = 1',
+                (rows, seconds, time.time()),
+            )
+
+    def stats(self):
+        '''Глубина очереди, возраст старейшей записи и скорость
+        переноса'''
+        depth, oldest = self.db.execute(
+            'SELECT COUNT(*), MIN(created) FROM outbox'
+        ).fetchone()
+        drained, batches, seconds, last_drain = self.db.execute(
+            'SELECT drained, batches, seconds, last_drain '
+            'FROM outbox_stats'
+        ).fetchone()
+        failed, = self.db.execute(
+            'SELECT COUNT(*) FROM outbox_failed'
+        ).fetchone()
+        return {
+            'depth': depth,
+            'lag': round(time.time() - oldest, 3) if oldest else 0.0,
+            'drained': drained,
+            'batches': batches,
+            'rate': round(drained / seconds, 1) if seconds else 0.0,
+            'last_drain': last_drain,
+            'failed': failed,
+        }
+
+
+_outboxes = {}
+
+
+def get_outbox():
+    path = str(settings.OUTBOX_PATH)
+    if path not in _outboxes:
+        _outboxes[path] = Outbox(path)
+    return _outboxes[path]
+
+
+def _date(created):
+    return datetime.datetime.fromtimestamp(created, datetime.timezone.utc)
+
+
+def add_comment(user, post_id, text):
+    get_outbox().put(COMMENT, user.pk, post_id, text)
+
+
+def follow(user, author_id):
+    get_outbox().put(FOLLOW, user.pk, author_id)
+
+
+def unfollow(user, author_id):
+    get_outbox().put(UNFOLLOW, user.pk, author_id)
+
+
+def pending_comments(user, post_id):
+    '''Комментарии пользователя к посту, ожидающие переноса в базу:
+    автор видит их сразу'''
+    if not settings.WRITE_BEHIND or not user.is_authenticated:
+        return []
+    return [
+        Comment(author=user, post_id=post_id, text=text,
+                pub_date=_date(created))
+        for kind, text, created in get_outbox().pending(
+            user.pk, post_id, COMMENT
+        )
+    ]
+
+
+def pending_following(user, author_id, following):
+    '''Состояние подписки с учетом еще не перенесенных записей'''
+    if not settings.WRITE_BEHIND or not user.is_authenticated:
+        return following
+    for kind, text, created in get_outbox().pending(
+            user.pk, author_id, FOLLOW, UNFOLLOW):
+        following = kind == FOLLOW
+    return following
+
+
+def write_comments(rows):
+    '''Создает комментарии одним bulk_create, возвращает посты,
+    которых они коснулись'''
+    posts = {
+        post.pk: post
+        for post in Post.objects.filter(
+            pk__in={row[3] for row in rows}
+        ).only('id', 'author_id', 'group_id')
+    }
+    users = set(User.objects.filter(
+        pk__in={row[2] for row in rows}
+    ).values_list('pk', flat=True))
+    # Строки, перенесенные до сбоя перед ack().
+    written = set(Comment.objects.filter(
+        outbox_id__in=[row[0] for row in rows]
+    ).values_list('outbox_id', flat=True))
+    # Пост или автора могли удалить, пока комментарий ждал в очереди.
+    comments = [
+        Comment(author_id=user_id, post_id=post_id, text=text,
+                pub_date=_date(created), outbox_id=outbox_id)
+        for outbox_id, _, user_id, post_id, text, created in rows
+        if post_id in posts and user_id in users
+        and outbox_id not in written
+    ]
+    with keep_dates(Comment, 'pub_date'):
+        Comment.objects.bulk_create(comments)
+    added = Counter(comment.post_id for comment in comments)
+    for post_id, delta in added.items():
+        counters.change_comments_count(post_id, delta)
+    return [posts[post_id] for post_id in added]
+
+
+def write_follows(rows):
+    '''Применяет подписки и отписки: для пары пользователь-автор
+    действует последняя запись'''
+    latest = {}
+    for _, kind, user_id, author_id, _, _ in rows:
+        latest[user_id, author_id] = kind
+    users = set(User.objects.filter(
+        pk__in={pk for pair in latest for pk in pair}
+    ).values_list('pk', flat=True))
+    follows = [
+        pair for pair, kind in latest.items()
+        if kind == FOLLOW and pair[0] != pair[1]
+        and pair[0] in users and pair[1] in users
+    ]
+    unfollows = [pair for pair, kind in latest.items() if kind == UNFOLLOW]
+    # Счетчики подписчиков растут только на действительно новые пары.
+    existing = set(Follow.objects.filter(
+        user_id__in={user_id for user_id, _ in follows},
+        author_id__in={author_id for _, author_id in follows},
+    ).values_list('user_id', 'author_id'))
+    created = [pair for pair in follows if pair not in existing]
+    Follow.objects.bulk_create(
+        [Follow(user_id=user_id, author_id=author_id)
+         for user_id, author_id in created],
+        ignore_conflicts=True,
+    )
+    added = Counter(author_id for _, author_id in created)
+    for author_id, delta in added.items():
+        counters.change_followers_count(author_id, delta)
+    if unfollows:
+        condition = Q()
+        for user_id, author_id in unfollows:
+            condition |= Q(user_id=user_id, author_id=author_id)
+        # delete() отправляет post_delete: ленты чистит сигнал.
+        Follow.objects.filter(condition).delete()
+    for user_id, author_id in follows:
+        timeline.backfill(user_id, author_id)
+    return {user_id for user_id, _ in follows + unfollows}
+
+
+def write(rows):
+    '''Переносит строки в базу одной транзакцией, возвращает
+    затронутые посты и читателей, чьи ленты изменились'''
+    with transaction.atomic():
+        posts = write_comments([row for row in rows if row[1] == COMMENT])
+        readers = write_follows(
+            [row for row in rows if row[1] != COMMENT]
+        )
+    return posts, readers
+
+
+def drain(batch_size=None):
+    '''Переносит пачку записей из очереди в базу.
+
+    Сигналы при bulk_create не срабатывают, поэтому счетчики,
+    ленты и версии кэша обновляются здесь же. Если база отвергла
+    пачку, строки переносятся по одной, а отвергнутые откладываются
+    в outbox_failed, чтобы не блокировать очередь. Ошибки соединения
+    не ловятся: пачка останется в очереди до следующей попытки.
+    Возвращает число обработанных записей.
+    '''
+    outbox = get_outbox()
+    rows = outbox.take(batch_size or settings.OUTBOX_BATCH_SIZE)
+    if not rows:
+        return 0
+    started = time.perf_counter()
+    failed = []
+    try:
+        posts, readers = write(rows)
+    except (DataError, IntegrityError):
+        posts, readers = [], set()
+        for row in rows:
+            try:
+                row_posts, row_readers = write([row])
+            except (DataError, IntegrityError) as error:
+                logger.exception('Строка очереди %s отложена', row[0])
+                failed.append((*row, str(error)))
+                continue
+            posts += row_posts
+            readers |= row_readers
+    versions.bump(
+        *{scope for post in posts for scope in versions.post_scopes(post)},
+        *(('timeline', user_id) for user_id in readers),
+    )
+    outbox.ack(
+        rows[-1][0], len(rows), time.perf_counter() - started, failed
+    )
+    logger.info(json.dumps(
+        {'rows': len(rows), **outbox.stats()}, ensure_ascii=False
+    ))
+    return len(rows)
@@ -0,0 +1,352 @@
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post, SearchTerm
+from .utils import decode_cursor, encode_cursor
+
+FTS_TABLE = 'posts_search_fts'
+DOCUMENTS_CACHE_KEY = 'search:documents'
+WORD_RE = re.compile(r'[^\W_]+')
+
+# Стеммер Snowball для русского языка.
+VOWELS = 'аеиоуыэюя'
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+)
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых'
+    r'|ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено'
+    r'|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем'
+    r'|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(rf'.*[^{VOWELS}]+[{VOWELS}].*ость?$')
+RV = re.compile(rf'^(.*?[{VOWELS}])(.*)$')
+
+
+def stem(word):
+    '''Основа слова по алгоритму Snowball. Слова не на кириллице
+    только приводятся к нижнему регистру'''
+    word = word.lower().replace('ё', 'е')
+    match = RV.match(word)
+    if not match:
+        return word
+    start, rv = match.groups()
+    # Шаг 1: деепричастие, иначе возвратная частица и окончание
+    # прилагательного, глагола или существительного.
+    stripped = PERFECTIVE_GERUND.sub('', rv, 1)
+    if stripped == rv:
+        rv = REFLEXIVE.sub('', rv, 1)
+        stripped = ADJECTIVE.sub('', rv, 1)
+        if stripped != rv:
+            rv = PARTICIPLE.sub('', stripped, 1)
+        else:
+            stripped = VERB.sub('', rv, 1)
+            rv = NOUN.sub('', rv, 1) if stripped == rv else stripped
+    else:
+        rv = stripped
+    # Шаг 2.
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    # Шаг 3: словообразовательный суффикс в R2.
+    if DERIVATIONAL.match(rv):
+        rv = re.sub('ость?$', '', rv)
+    # Шаг 4: мягкий знак, превосходная степень, двойная н.
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = re.sub('ейше?$', '', rv)
+        rv = re.sub('нн$', 'н', rv)
+    return start + rv
+
+
+def terms(text):
+    '''Основы всех слов текста по порядку'''
+    return [stem(word) for word in WORD_RE.findall(text)]
+
+
+def query_terms(query):
+    '''Различные основы слов запроса'''
+    return list(dict.fromkeys(
+        term for term in terms(query)
+        if len(term) <= SearchTerm._meta.get_field('term').max_length
+    ))
+
+
+def document_count():
+    '''Число постов для IDF. Точное значение ранжированию не нужно,
+    поэтому оно берется из кэша, а не считается на каждый запрос'''
+    return cache.get_or_set(
+        DOCUMENTS_CACHE_KEY,
+        Post.objects.count,
+        settings.SEARCH_DOCUMENTS_TIMEOUT,
+    )
+
+
+def fts5_available():
+    '''Создана ли таблица FTS5 (миграция создает ее, если SQLite
+    собран с FTS5)'''
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+class FTS5Index:
+    """Индекс в виртуальной таблице FTS5, ранжирование по bm25.
+
+    В таблицу пишутся уже выделенные основы слов, поэтому стемминг
+    одинаков для обоих индексов. Меньший score - лучше.
+    """
+
+    def index(self, post_id, text):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, terms) VALUES (%s, %s)',
+                [post_id, ' '.join(terms(text))],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def index_many(self, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, terms) VALUES (%s, %s)',
+                [(post_id, ' '.join(terms(text))) for post_id, text in rows],
+            )
+
+    def search(self, stems, after, limit):
+        match = ' '.join(f'"{term}"' for term in stems)
+        params = [match]
+        seek = ''
+        if after:
+            seek = 'WHERE score > %s OR (score = %s AND rowid > %s)'
+            params += [after[0], after[0], after[1]]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, score FROM ('
+                f'SELECT rowid, bm25({FTS_TABLE}) AS score FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s) {seek} '
+                f'ORDER BY score, rowid LIMIT %s',
+                params + [limit],
+            )
+            return cursor.fetchall()
+
+
+class TermIndex:
+    """Инвертированный индекс в таблице SearchTerm, ранжирование TF-IDF.
+
+    Работает на любой БД. Score отрицательный, чтобы порядок совпадал
+    с FTS5: меньше - лучше.
+    """
+
+    def index(self, post_id, text):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+        self.index_many([(post_id, text)])
+
+    def remove(self, post_id):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+    def clear(self):
+        SearchTerm.objects.all().delete()
+
+    def index_many(self, rows):
+        max_length = SearchTerm._meta.get_field('term').max_length
+        SearchTerm.objects.bulk_create(
+            SearchTerm(term=term, post_id=post_id, frequency=frequency)
+            for post_id, text in rows
+            for term, frequency in Counter(terms(text)).items()
+            if len(term) <= max_length
+        )
+
+    def search(self, stems, after, limit):
+        frequencies = dict(
+            SearchTerm.objects.filter(term__in=stems).order_by()
+            .values_list('term').annotate(Count('id'))
+        )
+        if len(frequencies) < len(stems):
+            # Все слова запроса обязательны.
+            return []
+        total = max(document_count(), 1)
+        score = -Sum(Case(
+            *(
+                When(term=term, then=F('frequency') * Value(
+                    math.log(1 + total / frequency), FloatField()
+                ))
+                for term, frequency in frequencies.items()
+            ),
+            output_field=FloatField(),
+        ))
+        matches = SearchTerm.objects.filter(term__in=stems).order_by(
+        ).values('post_id').annotate(
+            matched=Count('term'),
+            score=score,
+        ).filter(matched=len(stems))
+        if after:
+            matches = matches.filter(
+                Q(score__gt=after[0])
+                | Q(score=after[0], post_id__gt=after[1])
+            )
+        matches = matches.order_by('score', 'post_id')[:limit]
+        return [(row['post_id'], row['score']) for row in matches]
+
+
+def get_index():
+    '''Индекс по настройке SEARCH_BACKEND: fts5, terms или auto'''
+    backend = settings.SEARCH_BACKEND
+    if backend == 'fts5' or (backend == 'auto' and fts5_available()):
+        return FTS5Index()
+    return TermIndex()
+
+
+def index_post(post):
+    get_index().index(post.pk, post.text)
+
+
+def remove_post(post_id):
+    get_index().remove(post_id)
+
+
+def rebuild(batch_size=500):
+    '''Перестраивает индекс целиком, возвращает число постов'''
+    index = get_index()
+    total = 0
+    with transaction.atomic():
+        index.clear()
+        rows = []
+        posts = Post.objects.order_by().values_list('id', 'text')
+        for row in posts.iterator(chunk_size=batch_size):
+            rows.append(row)
+            if len(rows) == batch_size:
+                index.index_many(rows)
+                total += len(rows)
+                rows = []
+        index.index_many(rows)
+        total += len(rows)
+    cache.set(DOCUMENTS_CACHE_KEY, total, settings.SEARCH_DOCUMENTS_TIMEOUT)
+    return total
+
+
+def search_ids(query, after=None, limit=None):
+    '''Пары (id поста, score) по убыванию релевантности'''
+    stems = query_terms(query)
+    if not stems:
+        return []
+    if limit is None:
+        limit = settings.SEARCH_ADMIN_LIMIT
+    return get_index().search(stems, after, limit)
+
+
+def snippet(text, stems, words=None):
+    '''Фрагмент текста вокруг первого найденного слова,
+    найденные слова выделены тегом mark'''
+    words = words or settings.SEARCH_SNIPPET_WORDS
+    stems = set(stems)
+    tokens = list(WORD_RE.finditer(text))
+    first = next(
+        (i for i, token in enumerate(tokens)
+         if stem(token.group()) in stems),
+        0
+    )
+    start = max(0, first - words // 3)
+    window = tokens[start:start + words]
+    if not window:
+        return escape(text)
+    parts = ['…'] if start else []
+    position = window[0].start()
+    for token in window:
+        parts.append(escape(text[position:token.start()]))
+        if stem(token.group()) in stems:
+            parts.append(f'<mark>{escape(token.group())}</mark>')
+        else:
+            parts.append(escape(token.group()))
+        position = token.end()
+    if start + words < len(tokens):
+        parts.append('…')
+    else:
+        parts.append(escape(text[position:]))
+    return mark_safe(''.join(parts))
+
+
+class SearchPage:
+    '''Страница результатов поиска: посты и курсор следующей страницы'''
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def parse_cursor(cursor):
+    '''(score, id) из курсора, для битого курсора - None'''
+    values = decode_cursor(cursor) if cursor else None
+    try:
+        score, post_id = values
+        score, post_id = float(score), int(post_id)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(score):
+        return None
+    return score, post_id
+
+
+def search_posts(query, cursor=None, per_page=None):
+    '''Страница постов по запросу, курсор - (score, id) последнего поста'''
+    per_page = per_page or settings.POST_ON_PAGE
+    after = parse_cursor(cursor)
+    found = search_ids(query, after, per_page + 1)
+    next_cursor = None
+    if len(found) > per_page:
+        found = found[:per_page]
+        post_id, score = found[-1]
+        next_cursor = encode_cursor([score, post_id])
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [post_id for post_id, score in found]
+    )
+    stems = query_terms(query)
+    object_list = []
+    for post_id, score in found:
+        post = posts.get(post_id)
+        if post is not None:
+            post.snippet = snippet(post.text, stems)
+            object_list.append(post)
+    return SearchPage(object_list, next_cursor)
@@ -0,0 +1,249 @@
+import datetime
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import CommandError
+from faker import Faker
+
+from core.models import keep_dates
+
+from . import search
+from .models import Comment, Follow, Group, Post, User
+from .transfer import Progress, rebuild_derived
+
+START = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+SPAN = 3 * 365 * 24 * 60 * 60
+
+_faker = None
+
+
+def _generators(seed, model, number):
+    '''Генераторы пачки: зависят только от seed, модели и номера пачки,
+    поэтому данные не зависят от числа процессов'''
+    global _faker
+    if _faker is None:
+        _faker = Faker('ru_RU')
+    value = f'{seed}:{model}:{number}'
+    _faker.seed_instance(value)
+    return random.Random(value), _faker
+
+
+def power_law(rnd, count):
+    '''Индекс от 0 до count - 1 с вероятностью примерно 1 / (индекс + 1):
+    немногие первые индексы выпадают чаще всех остальных'''
+    # Обратная функция распределения: (count + 1) ** random() лежит
+    # в [1, count + 1), min() - на случай округления.
+    return min(int((count + 1) ** rnd.random()) - 1, count - 1)
+
+
+def user_rows(job):
+    seed, number, start, size = job
+    rnd, fake = _generators(seed, 'user', number)
+    return [
+        (f'{fake.user_name()}_{index}', fake.first_name(), fake.last_name())
+        for index in range(start, start + size)
+    ]
+
+
+def post_rows(job):
+    seed, number, start, size, users, groups = job
+    rnd, fake = _generators(seed, 'post', number)
+    return [
+        (
+            power_law(rnd, users),
+            rnd.randrange(groups) if groups and rnd.random() < 0.7 else None,
+            fake.paragraph(nb_sentences=rnd.randint(1, 8)),
+            rnd.randrange(SPAN),
+        )
+        for _ in range(size)
+    ]
+
+
+def comment_rows(job):
+    seed, number, start, size, users, posts = job
+    rnd, fake = _generators(seed, 'comment', number)
+    return [
+        (
+            power_law(rnd, posts),
+            rnd.randrange(users),
+            fake.sentence(),
+            rnd.randrange(SPAN),
+        )
+        for _ in range(size)
+    ]
+
+
+def follow_rows(job):
+    '''Подписки пользователей start..start + size: число подписок
+    и популярность авторов распределены по степенному закону'''
+    seed, number, start, size, users, mean = job
+    rnd, fake = _generators(seed, 'follow', number)
+    rows = []
+    for user in range(start, start + size):
+        count = min(int(rnd.paretovariate(2) * mean / 2), users - 1)
+        authors = set()
+        for _ in range(count * 2):
+            if len(authors) == count:
+                break
+            author = power_law(rnd, users)
+            if author != user:
+                authors.add(author)
+        rows.extend((user, author) for author in sorted(authors))
+    return rows
+
+
+def _date(offset):
+    return START + datetime.timedelta(seconds=offset)
+
+
+class Seeder:
+    """Наполняет базу синтетическими данными.
+
+    Строки генерируются пачками, при workers > 0 - в пуле процессов,
+    записывает их bulk_create только основной процесс. Пачки ссылаются
+    на пользователей, группы и посты по порядковому номеру, номера
+    переводятся в id по спискам созданных объектов.
+    """
+
+    def __init__(self, seed=0, batch_size=5000, workers=0,
+                 password='password', stream=None):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.workers = workers
+        self.password = make_password(password)
+        self.progress = Progress(stream) if stream else None
+        self.users = []
+        self.groups = []
+        self.posts = []
+
+    def jobs(self, total, *args):
+        return [
+            (self.seed, number, start,
+             min(self.batch_size, total - start), *args)
+            for number, start in enumerate(range(0, total, self.batch_size))
+        ]
+
+    def batches(self, executor, func, jobs):
+        if executor is None:
+            return map(func, jobs)
+        return executor.map(func, jobs)
+
+    def check_unique(self, label, model, field, values):
+        '''Имена строятся по seed и номеру: повторный запуск с тем же
+        seed на заполненной базе дал бы те же имена'''
+        existing = list(model.objects.filter(
+            **{f'{field}__in': values}
+        ).values_list(field, flat=True)[:3])
+        if existing:
+            raise CommandError(
+                f'{label} {", ".join(existing)} '
+                f'уже есть в базе. Укажите другой --seed или очистите базу'
+            )
+
+    def tick(self, model, rows):
+        if self.progress:
+            self.progress.tick(model, rows)
+
+    def run(self, users, posts, comments, groups=10, follows=20):
+        executor = None
+        if self.workers:
+            executor = ProcessPoolExecutor(
+                self.workers, initializer=django.setup
+            )
+        try:
+            self.create_groups(groups)
+            for rows in self.batches(
+                    executor, user_rows, self.jobs(users)):
+                self.create_users(rows)
+            for rows in self.batches(executor, post_rows, self.jobs(
+                    posts, len(self.users), len(self.groups))):
+                self.create_posts(rows)
+            for rows in self.batches(executor, comment_rows, self.jobs(
+                    comments, len(self.users), len(self.posts))):
+                self.create_comments(rows)
+            for rows in self.batches(executor, follow_rows, self.jobs(
+                    len(self.users), len(self.users), follows)):
+                self.create_follows(rows)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        rebuild_derived()
+        if self.progress:
+            return self.progress.summary()
+
+    def create_groups(self, count):
+        rnd, fake = _generators(self.seed, 'group', 0)
+        groups = [
+            Group(
+                title=fake.catch_phrase()[:200],
+                slug=f'group-{self.seed}-{index}',
+                description=fake.paragraph(),
+            )
+            for index in range(count)
+        ]
+        self.check_unique(
+            'Группы', Group, 'slug', [group.slug for group in groups]
+        )
+        Group.objects.bulk_create(groups)
+        self.groups = [group.pk for group in groups]
+        self.tick('group', len(groups))
+
+    def create_users(self, rows):
+        users = [
+            User(
+                username=username,
+                first_name=first_name,
+                last_name=last_name,
+                password=self.password,
+            )
+            for username, first_name, last_name in rows
+        ]
+        self.check_unique(
+            'Пользователи', User, 'username', [user.username for user in users]
+        )
+        User.objects.bulk_create(users)
+        self.users.extend(user.pk for user in users)
+        self.tick('user', len(users))
+
+    def create_posts(self, rows):
+        posts = [
+            Post(
+                author_id=self.users[author],
+                group_id=None if group is None else self.groups[group],
+                text=text,
+                pub_date=_date(offset),
+            )
+            for author, group, text, offset in rows
+        ]
+        with keep_dates(Post, 'pub_date'):
+            Post.objects.bulk_create(posts)
+        self.posts.extend(post.pk for post in posts)
+        search.get_index().index_many((post.pk, post.text) for post in posts)
+        self.tick('post', len(posts))
+
+    def create_comments(self, rows):
+        comments = [
+            Comment(
+                post_id=self.posts[post],
+                author_id=self.users[author],
+                text=text,
+                pub_date=_date(offset),
+            )
+            for post, author, text, offset in rows
+        ]
+        with keep_dates(Comment, 'pub_date'):
+            Comment.objects.bulk_create(comments)
+        self.tick('comment', len(comments))
+
+    def create_follows(self, rows):
+        Follow.objects.bulk_create(
+            (
+                Follow(user_id=self.users[user],
+                       author_id=self.users[author])
+                for user, author in rows
+            ),
+            ignore_conflicts=True,
+        )
+        self.tick('follow', len(rows))
@@ -0,0 +1,97 @@
+from django.core.files.storage import default_storage
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache as versions
+from . import counters, search, timeline
+from .models import Comment, Follow, Group, Post, User
+
+
+def release_image(name, variants):
+    '''Снимает ссылки поста на картинку и ее варианты в хранилище'''
+    for file_name in (name, *variants.get('files', ())):
+        if file_name:
+            default_storage.delete(file_name)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    if instance.pk:
+        instance.previous_group_id, *instance.previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group_id', 'image', 'variants'
+            ).first() or (None, '', {})
+        )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        counters.change_posts_count(instance.author_id, 1)
+        timeline.fan_out_post(instance)
+    if update_fields is None or 'text' in update_fields:
+        search.index_post(instance)
+    scopes = versions.post_scopes(instance)
+    previous_group_id = getattr(instance, 'previous_group_id', None)
+    if previous_group_id and previous_group_id != instance.group_id:
+        scopes.append(('group', previous_group_id))
+    versions.bump(*scopes)
+    previous_image = getattr(instance, 'previous_image', None)
+    if previous_image and previous_image[0] != instance.image.name:
+        # Картинку заменили: старая и ее варианты больше не нужны.
+        release_image(*previous_image)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    release_image(instance.image.name, instance.variants)
+    counters.change_posts_count(instance.author_id, -1)
+    search.remove_post(instance.pk)
+    versions.bump(*versions.post_scopes(instance))
+
+
+def _comment_changed(instance, delta):
+    if delta:
+        counters.change_comments_count(instance.post_id, delta)
+    # Счетчик комментариев выводится и в лентах. Ленты подписчиков
+    # зависят от поколения автора, поэтому обход подписчиков не нужен.
+    versions.bump(*versions.post_scopes(instance.post))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    _comment_changed(instance, 1 if created else 0)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    _comment_changed(instance, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_followers_count(instance.author_id, 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+    versions.bump(('timeline', instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_followers_count(instance.author_id, -1)
+    timeline.remove_author(instance.user_id, instance.author_id)
+    versions.bump(('timeline', instance.user_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    versions.bump(('groups',))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login.
+    if created or (update_fields and 'username' not in update_fields):
+        return
+    versions.bump(('users',))
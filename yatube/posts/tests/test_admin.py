@@ -0,0 +1,81 @@
+# posts/tests/test_admin.py
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+CHANGELISTS = (
+    'admin:posts_post_changelist',
+    'admin:posts_comment_changelist',
+    'admin:posts_follow_changelist',
+)
+
+
+class AdminChangelistTest(TestCase):
+    '''Число запросов списков админки не зависит от числа строк'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        for i in range(3):
+            Group.objects.create(
+                title=f'Группа {i}', slug=f'group-{i}', description='-'
+            )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        groups = list(Group.objects.all())
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'author-{User.objects.count()}'
+            )
+            post = Post.objects.create(
+                text=f'Пост {i}', author=author, group=groups[i % 3]
+            )
+            Comment.objects.create(text=f'Ответ {i}', post=post, author=author)
+            Follow.objects.create(user=author, author=self.admin)
+
+    def queries(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url), params)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries]
+
+    def test_query_count_does_not_grow(self):
+        '''Запросов столько же для 2 и для 20 строк'''
+        self.add_rows(2)
+        few = {url: len(self.queries(url)) for url in CHANGELISTS}
+        self.add_rows(18)
+        for url in CHANGELISTS:
+            with self.subTest(url=url):
+                self.assertEqual(len(self.queries(url)), few[url])
+
+    def test_pinned_query_counts(self):
+        '''Число запросов на страницу списка'''
+        self.add_rows(5)
+        # Сессия и пользователь, оценка количества (статистика SQLite
+        # и MAX(id)), строки страницы; у постов еще список групп,
+        # у постов и комментариев - два запроса date_hierarchy.
+        expected = {
+            'admin:posts_post_changelist': 8,
+            'admin:posts_comment_changelist': 7,
+            'admin:posts_follow_changelist': 5,
+        }
+        for url, count in expected.items():
+            with self.subTest(url=url):
+                self.assertEqual(len(self.queries(url)), count)
+
+    def test_no_full_count(self):
+        '''Список без фильтров не считает COUNT(*) по таблице'''
+        self.add_rows(3)
+        for url in CHANGELISTS:
+            with self.subTest(url=url):
+                self.assertFalse([
+                    sql for sql in self.queries(url) if 'COUNT(' in sql
+                ])
@@ -4,8 +4,11 @@ import tempfile
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.core.cache import cache
 from django.test import Client, TestCase, override_settings
 
+from core.storage import content_name
+
 from ..models import Comment, Post, Group, User
 from ..models import IMAGE_DIRECTORY
 
@@ -36,6 +39,7 @@ class PostFormTest(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -82,8 +86,31 @@ class PostFormTest(TestCase):
         self.assertEqual(first_post.group.id, form_data['group'])
         self.assertEqual(
             first_post.image,
-            (f'{IMAGE_DIRECTORY}{image_name}')
+            content_name(
+                f'{IMAGE_DIRECTORY}{image_name}',
+                self.image_create(image_name),
+            )
+        )
+
+    @override_settings(IMAGE_WORKERS=0)
+    def test_create_post_builds_thumbnails(self):
+        '''Миниатюры строятся при загрузке вместе с вариантами'''
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с миниатюрой',
+                'image': self.image_create('thumb.gif'),
+            },
+            follow=True
+        )
+        post = Post.objects.get(text='Пост с миниатюрой')
+        self.assertTrue(post.thumbnail_feed)
+        self.assertTrue(post.thumbnail_detail)
+        self.assertIn(
+            post.thumbnail_feed[len(settings.MEDIA_URL):],
+            post.variants['files'],
         )
+        self.assertContains(response, post.variants['src'])
 
     def test_edit_post(self):
         '''Пост редактируется в базе данных и происходит redirect'''
@@ -109,7 +136,10 @@ class PostFormTest(TestCase):
         self.assertEqual(modified_post.group.id, form_data['group'])
         self.assertEqual(
             modified_post.image,
-            (f'{IMAGE_DIRECTORY}{image_name}')
+            content_name(
+                f'{IMAGE_DIRECTORY}{image_name}',
+                self.image_create(image_name),
+            )
         )
 
     def test_comment_create(self):
@@ -0,0 +1,156 @@
+import io
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from core.storage import content_name, references
+
+from ..images import THUMBNAILS, apply_variants, process_image
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def jpeg_with_exif(width, height):
+    image = Image.new('RGB', (width, height), 'red')
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    out = io.BytesIO()
+    image.save(out, 'JPEG', exif=exif)
+    return out.getvalue()
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    IMAGE_WORKERS=0,
+    IMAGE_MAX_SIDE=1200,
+)
+class ImageVariantsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create_post(self, content, name='photo.jpg'):
+        self.client.post(
+            reverse('posts:post_create'),
+            {
+                'text': 'Пост с фото',
+                'image': SimpleUploadedFile(name, content, 'image/jpeg'),
+            },
+        )
+        return Post.objects.get(text='Пост с фото')
+
+    def test_upload_builds_variants(self):
+        """Загрузка строит варианты по ширинам в WebP и JPEG."""
+        post = self.create_post(jpeg_with_exif(2000, 1000))
+        self.assertEqual(post.variants['width'], 960)
+        self.assertEqual(post.variants['height'], 480)
+        for extension in ('webp', 'jpeg'):
+            with self.subTest(extension=extension):
+                widths = [
+                    int(entry.rsplit(' ', 1)[1][:-1])
+                    for entry in post.variants[extension].split(', ')
+                ]
+                self.assertEqual(widths, [320, 640, 960])
+        for name in post.variants['files']:
+            self.assertTrue(default_storage.exists(name))
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, post.variants['src'])
+
+    def test_original_capped_without_exif(self):
+        """Оригинал уменьшается до IMAGE_MAX_SIDE и теряет EXIF."""
+        post = self.create_post(jpeg_with_exif(2000, 1000))
+        with default_storage.open(post.image.name) as source:
+            image = Image.open(source)
+            self.assertEqual(image.size, (1200, 600))
+            self.assertFalse(image.getexif())
+        self.assertTrue(post.thumbnail_feed)
+
+    def test_thumbnails_cropped(self):
+        """Миниатюры кадрируются вместе с вариантами."""
+        post = self.create_post(jpeg_with_exif(2000, 1000))
+        for field in THUMBNAILS:
+            with self.subTest(field=field):
+                url = getattr(post, field)
+                name = url[len(settings.MEDIA_URL):]
+                self.assertIn(name, post.variants['files'])
+                with default_storage.open(name) as source:
+                    self.assertEqual(Image.open(source).size, (960, 339))
+
+    def test_small_image_kept(self):
+        """Маленькая картинка без EXIF не перекодируется."""
+        out = io.BytesIO()
+        Image.new('RGB', (200, 100), 'blue').save(out, 'PNG')
+        post = self.create_post(out.getvalue(), 'small.png')
+        self.assertEqual(
+            post.image.name,
+            content_name('posts/small.png', ContentFile(out.getvalue())),
+        )
+        self.assertIn(' 200w', post.variants['jpeg'])
+
+    def test_replaced_image_discards_variants(self):
+        """Варианты устаревшей картинки не сохраняются: ссылки на них
+        снимаются."""
+        post = self.create_post(jpeg_with_exif(400, 300))
+        original, variants = process_image(post.image.name)
+        Post.objects.filter(pk=post.pk).update(image='posts/other.jpg')
+        apply_variants(post.pk, post.image.name, original, variants)
+        for name in variants['files']:
+            # Остаются только ссылки из вариантов самого поста.
+            self.assertEqual(
+                references(name), post.variants['files'].count(name)
+            )
+
+    def test_rebuilt_variants_keep_one_reference(self):
+        """Перестройка вариантов не копит ссылки на файлы."""
+        post = self.create_post(jpeg_with_exif(400, 300))
+        for _ in range(2):
+            call_command(
+                'generate_image_variants', '--all', stdout=io.StringIO()
+            )
+        post.refresh_from_db()
+        files = post.variants['files']
+        for name in files:
+            # Одинаковые миниатюры - один файл с двумя ссылками.
+            self.assertEqual(references(name), files.count(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        for name in post.variants['files']:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_delete_post_removes_files(self):
+        """Удаление поста удаляет картинку и варианты."""
+        post = self.create_post(jpeg_with_exif(400, 300))
+        files = [post.image.name, *post.variants['files']]
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        for name in files:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_command_fills_missing_variants(self):
+        """Команда строит варианты для старых постов."""
+        post = self.create_post(jpeg_with_exif(400, 300))
+        Post.objects.filter(pk=post.pk).update(variants={})
+        call_command('generate_image_variants', stdout=io.StringIO())
+        post.refresh_from_db()
+        self.assertIn(' 320w', post.variants['webp'])
@@ -1,7 +1,10 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
-from ..models import Post, Group
+from ..models import AuthorStats, Comment, Post, Group
 
 User = get_user_model()
 
@@ -48,3 +51,44 @@ class PostModelTest(TestCase):
                 self.assertEqual(
                     post._meta.get_field(field).verbose_name, expected_value
                 )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.post = Post.objects.create(text='Тестовый пост', author=cls.user)
+
+    def test_posts_count(self):
+        """Счетчик постов автора меняется при создании и удалении."""
+        self.assertEqual(self.user.stats.posts_count, 1)
+        post = Post.objects.create(text='Второй пост', author=self.user)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user).posts_count, 2)
+        post.delete()
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user).posts_count, 1)
+
+    def test_comments_count(self):
+        """Счетчик комментариев поста меняется при создании и удалении."""
+        comment = Comment.objects.create(
+            text='Комментарий', post=self.post, author=self.user)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_reconcile_counters(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        Comment.objects.create(
+            text='Комментарий', post=self.post, author=self.user)
+        Post.objects.update(comments_count=10)
+        AuthorStats.objects.update(posts_count=10, followers_count=10)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        stats = AuthorStats.objects.get(user=self.user)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 0)
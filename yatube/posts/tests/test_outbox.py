@@ -0,0 +1,170 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..cache import cache_version
+from ..models import (
+    AuthorStats, Comment, Follow, Post, TimelineEntry, User
+)
+from ..outbox import COMMENT, Outbox, drain, get_outbox
+
+
+class WriteBehindTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(
+            WRITE_BEHIND=True,
+            OUTBOX_PATH=os.path.join(directory, 'outbox.sqlite3'),
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(lambda: get_outbox().close())
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def drain(self):
+        with self.assertLogs('yatube.outbox', 'INFO'):
+            return drain()
+
+    def comment(self, text):
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': text},
+        )
+
+    def test_comment_waits_in_outbox(self):
+        """Комментарий попадает в очередь, автор видит его сразу."""
+        self.comment('В очереди')
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(get_outbox().stats()['depth'], 1)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertContains(response, 'В очереди')
+        other = Client()
+        other.force_login(self.author)
+        response = other.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertNotContains(response, 'В очереди')
+
+    def test_drain_writes_comments(self):
+        """Перенос создает комментарии, счетчик и меняет версию поста."""
+        self.comment('Первый')
+        self.comment('Второй')
+        version = cache_version(('post', self.post.pk))
+        self.assertEqual(self.drain(), 2)
+        self.assertEqual(
+            list(Comment.objects.order_by('id').values_list(
+                'text', flat=True
+            )),
+            ['Первый', 'Второй'],
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+        self.assertNotEqual(cache_version(('post', self.post.pk)), version)
+        stats = get_outbox().stats()
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['drained'], 2)
+        self.assertEqual(drain(), 0)
+
+    def test_comment_to_deleted_post_dropped(self):
+        """Комментарий к удаленному посту не переносится."""
+        post = Post.objects.create(text='Удаляемый', author=self.author)
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': 'Поздно'},
+        )
+        post.delete()
+        self.assertEqual(self.drain(), 1)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_comment_by_deleted_user_dropped(self):
+        """Комментарий удаленного пользователя не переносится."""
+        user = User.objects.create_user(username='gone')
+        get_outbox().put(COMMENT, user.pk, self.post.pk, 'Поздно')
+        user.delete()
+        self.assertEqual(self.drain(), 1)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(get_outbox().stats()['failed'], 0)
+
+    def test_rejected_row_set_aside(self):
+        """Строка, которую отвергла база, откладывается, остальные
+        переносятся."""
+        self.comment('Первый')
+        get_outbox().put(COMMENT, self.reader.pk, self.post.pk, None)
+        self.comment('Второй')
+        self.assertEqual(self.drain(), 3)
+        self.assertEqual(Comment.objects.count(), 2)
+        stats = get_outbox().stats()
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['failed'], 1)
+
+    def test_repeated_batch_not_duplicated(self):
+        """Пачка, перенесенная до сбоя перед ack(), не дублируется."""
+        self.comment('Один раз')
+        with mock.patch.object(Outbox, 'ack', side_effect=OSError):
+            with self.assertRaises(OSError):
+                drain()
+        self.assertEqual(get_outbox().stats()['depth'], 1)
+        self.assertEqual(self.drain(), 1)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+    def test_last_follow_action_wins(self):
+        """Для пары пользователь-автор действует последняя запись."""
+        follow = reverse('posts:profile_follow', args=['author'])
+        unfollow = reverse('posts:profile_unfollow', args=['author'])
+        self.client.get(follow)
+        response = self.client.get(reverse('posts:profile', args=['author']))
+        self.assertTrue(response.context['following'])
+        self.client.get(unfollow)
+        self.client.get(follow)
+        self.drain()
+        self.assertTrue(
+            Follow.objects.filter(user=self.reader, author=self.author)
+            .exists()
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.reader, post=self.post
+            ).exists()
+        )
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).followers_count, 1)
+        self.client.get(unfollow)
+        response = self.client.get(reverse('posts:profile', args=['author']))
+        self.assertFalse(response.context['following'])
+        self.drain()
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).followers_count, 0)
+
+    def test_drain_command(self):
+        """Команда с --once переносит очередь и выводит статистику."""
+        for number in range(3):
+            self.comment(f'Комментарий {number}')
+        out = StringIO()
+        with self.assertLogs('yatube.outbox', 'INFO') as logs:
+            call_command(
+                'drain_outbox', '--once', '--batch-size=2', stdout=out
+            )
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(Comment.objects.count(), 3)
+        self.assertIn('"depth": 0', out.getvalue())
+        self.assertIn('"batches": 2', out.getvalue())
@@ -0,0 +1,76 @@
+# posts/tests/test_queries.py
+import re
+
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?posts_\w+(?! USING)( |$)')
+TEMP_SORT = 'USE TEMP B-TREE FOR'
+
+
+class QueryPlanTest(TestCase):
+    '''Запросы лент идут по индексам, без полного сканирования и
+    сортировки во временном B-дереве'''
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.follower = User.objects.create_user(username='test_follower')
+        cls.group = Group.objects.create(
+            title='Тест группа',
+            slug='test_slug',
+            description='Тест описание'
+        )
+        Follow.objects.create(user=cls.follower, author=cls.user)
+        for i in range(15):
+            cls.post = Post.objects.create(
+                text=f'Тестовый пост {i}',
+                author=cls.user,
+                group=cls.group,
+            )
+            Comment.objects.create(
+                text=f'Комментарий {i}', post=cls.post, author=cls.user)
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.id}),
+            reverse('posts:post_comments', kwargs={'post_id': cls.post.id}),
+            reverse('posts:follow_index'),
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.follower)
+
+    def query_plans(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                yield sql, [row[-1] for row in cursor.fetchall()]
+
+    def check_plans(self):
+        for url in self.urls:
+            for sql, plan in self.query_plans(url):
+                with self.subTest(url=url, sql=sql):
+                    for step in plan:
+                        self.assertIsNone(FULL_SCAN.match(step), plan)
+                        self.assertNotIn(TEMP_SORT, step, plan)
+
+    def test_page_queries_use_indexes(self):
+        '''Постраничные ленты используют индексы'''
+        self.check_plans()
+
+    @override_settings(KEYSET_PAGINATION=True)
+    def test_keyset_queries_use_indexes(self):
+        '''Курсорные ленты используют индексы'''
+        self.check_plans()
@@ -0,0 +1,141 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Post, SearchTerm
+from ..search import FTS5Index, TermIndex, get_index, rebuild, stem
+from ..utils import encode_cursor
+
+User = get_user_model()
+
+
+class StemmerTest(TestCase):
+    def test_word_forms_have_same_stem(self):
+        """Формы одного слова сводятся к одной основе."""
+        forms = (
+            ('кот', 'коты', 'котами'),
+            ('книга', 'книги', 'книгу'),
+            ('читали', 'читать', 'читаю'),
+            ('ёжик', 'ежики'),
+        )
+        for words in forms:
+            with self.subTest(words=words):
+                self.assertEqual(len({stem(word) for word in words}), 1)
+
+    def test_latin_words_are_lowercased(self):
+        self.assertEqual(stem('Django'), 'django')
+
+
+class SearchMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='search_user')
+        cls.cats = Post.objects.create(
+            text='Коты любят спать. Кот спал весь день.',
+            author=cls.user,
+        )
+        cls.cat = Post.objects.create(
+            text='Про котов и собак',
+            author=cls.user,
+        )
+        cls.dogs = Post.objects.create(
+            text='Собаки гуляют во дворе',
+            author=cls.user,
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query, **params):
+        return self.guest_client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+
+    def test_index_backend(self):
+        self.assertIsInstance(get_index(), self.index_class)
+
+    def test_search_ranks_and_highlights(self):
+        """Находит формы слова, чаще упомянутое - выше, слова выделены."""
+        response = self.search('котам')
+        posts = response.context['page_obj'].object_list
+        self.assertEqual(posts, [self.cats, self.cat])
+        self.assertIn('<mark>Коты</mark>', posts[0].snippet)
+        self.assertContains(response, '<mark>котов</mark>')
+
+    def test_all_words_required(self):
+        response = self.search('кот гуляют')
+        self.assertEqual(response.context['page_obj'].object_list, [])
+        self.assertContains(response, 'Ничего не найдено')
+
+    def test_keyset_pagination(self):
+        with self.settings(POST_ON_PAGE=1):
+            first = self.search('кот').context['page_obj']
+            self.assertTrue(first.has_next())
+            second = self.search(
+                'кот', after=first.next_cursor
+            ).context['page_obj']
+        self.assertEqual(first.object_list, [self.cats])
+        self.assertEqual(second.object_list, [self.cat])
+        self.assertFalse(second.has_next())
+
+    def test_broken_cursor_shows_first_page(self):
+        """Курсор с чужими типами значений дает первую страницу."""
+        for values in ([{'a': 1}, 2], ['score', 'id'], [1], 'кот'):
+            with self.subTest(values=values):
+                response = self.search('кот', after=encode_cursor(values))
+                self.assertEqual(
+                    response.context['page_obj'].object_list,
+                    [self.cats, self.cat],
+                )
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.create(text='Попугай', author=self.user)
+        self.assertEqual(
+            self.search('попугаи').context['page_obj'].object_list, [post]
+        )
+        post.text = 'Канарейка'
+        post.save()
+        self.assertEqual(
+            self.search('попугай').context['page_obj'].object_list, []
+        )
+        post.delete()
+        self.assertEqual(
+            self.search('канарейка').context['page_obj'].object_list, []
+        )
+
+    def test_rebuild(self):
+        Post.objects.filter(pk=self.dogs.pk).update(text='Лошади')
+        self.assertEqual(rebuild(), 3)
+        posts = self.search('лошадь').context['page_obj'].object_list
+        self.assertEqual(posts, [self.dogs])
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собака'}
+        )
+        self.assertEqual(
+            set(response.context['cl'].result_list),
+            {self.cat, self.dogs},
+        )
+
+
+@override_settings(SEARCH_BACKEND='fts5')
+class FTS5SearchTest(SearchMixin, TestCase):
+    index_class = FTS5Index
+
+
+@override_settings(SEARCH_BACKEND='terms')
+class TermSearchTest(SearchMixin, TestCase):
+    index_class = TermIndex
+
+    def test_terms_stored(self):
+        self.assertEqual(
+            SearchTerm.objects.get(post=self.cats, term=stem('кот')).frequency,
+            2,
+        )
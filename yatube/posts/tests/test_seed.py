@@ -0,0 +1,82 @@
+import random
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+
+import django
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
+from django.test import TestCase
+
+from .. import timeline
+from ..models import AuthorStats, Comment, Follow, Post, TimelineEntry, User
+from ..seeding import Seeder, follow_rows, post_rows, power_law
+
+
+class SeedCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed', users=30, posts=200, comments=300, groups=3,
+            follows=6, seed=1, batch_size=64,
+            stdout=StringIO(), stderr=StringIO(),
+        )
+
+    def test_counts(self):
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertTrue(Follow.objects.exists())
+        self.assertFalse(
+            Follow.objects.filter(user_id=F('author_id')).exists()
+        )
+
+    def test_derived_data(self):
+        """Счетчики и ленты совпадают с пересчитанными с нуля."""
+        post = Post.objects.order_by('-comments_count').first()
+        self.assertEqual(post.comments_count, post.comments.count())
+        stats = AuthorStats.objects.get(user=post.author)
+        self.assertEqual(stats.posts_count, post.author.posts.count())
+        seeded = set(TimelineEntry.objects.values_list('user', 'post'))
+        for user_id in User.objects.values_list('id', flat=True):
+            timeline.rebuild(user_id)
+        self.assertEqual(
+            seeded, set(TimelineEntry.objects.values_list('user', 'post'))
+        )
+
+    def test_seed_twice(self):
+        """Повторный запуск с тем же seed отклоняется без записи."""
+        with self.assertRaisesMessage(CommandError, 'уже есть в базе'):
+            call_command(
+                'seed', users=30, posts=10, comments=0, groups=3, seed=1,
+                stdout=StringIO(), stderr=StringIO(),
+            )
+        self.assertEqual(User.objects.count(), 30)
+
+    def test_power_law_range(self):
+        """Выпадают все индексы, включая последний."""
+        rnd = random.Random(0)
+        self.assertEqual(
+            {power_law(rnd, 3) for _ in range(1000)}, {0, 1, 2}
+        )
+
+    def test_power_law_follows(self):
+        """Несколько авторов собирают большую часть подписчиков."""
+        rows = follow_rows((0, 0, 0, 1000, 1000, 20))
+        followers = sorted(
+            (sum(1 for user, author in rows if author == index)
+             for index in range(1000)),
+            reverse=True,
+        )
+        self.assertGreater(sum(followers[:10]), sum(followers) * 0.2)
+
+    def test_deterministic(self):
+        """Пачки зависят только от seed, а не от числа процессов."""
+        seeder = Seeder(seed=5, batch_size=10)
+        jobs = seeder.jobs(40, 30, 3)
+        with ProcessPoolExecutor(2, initializer=django.setup) as executor:
+            pooled = list(executor.map(post_rows, jobs))
+        self.assertEqual(list(map(post_rows, jobs)), pooled)
+        self.assertNotEqual(
+            post_rows(jobs[0]), post_rows(Seeder(seed=6).jobs(10, 30, 3)[0])
+        )
@@ -0,0 +1,135 @@
+import datetime
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.storage import references
+
+from ..models import Comment, Follow, Group, Post, TimelineEntry, User
+from ..search import search_ids
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TransferCommandsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pub_date = timezone.now() - datetime.timedelta(days=30)
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        post = Post.objects.create(
+            text='Старый пост про котов',
+            author=author,
+            group=group,
+            image=SimpleUploadedFile('cat.gif', SMALL_GIF, 'image/gif'),
+        )
+        Post.objects.filter(pk=post.pk).update(pub_date=cls.pub_date)
+        Post.objects.create(text='Пост без группы', author=reader)
+        Comment.objects.create(text='Комментарий', post=post, author=reader)
+        Follow.objects.create(user=reader, author=author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.media_dir = os.path.join(self.directory, 'media')
+
+    def round_trip(self, path, *options):
+        call_command(
+            'export_data', path, *options, '--media-dir', self.media_dir,
+            stderr=StringIO(),
+        )
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        out = StringIO()
+        call_command(
+            'import_data', path, *options, '--batch-size', '1',
+            '--media-dir', self.media_dir, stdout=out, stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def assert_restored(self):
+        post = Post.objects.get(text='Старый пост про котов')
+        self.assertEqual(post.pub_date, self.pub_date)
+        self.assertEqual(post.group.slug, 'group')
+        self.assertEqual(post.author.username, 'author')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.author.stats.posts_count, 1)
+        self.assertTrue(
+            os.path.exists(os.path.join(TEMP_MEDIA_ROOT, post.image.name))
+        )
+        self.assertEqual(post.comments.get().author.username, 'reader')
+        reader = User.objects.get(username='reader')
+        self.assertFalse(reader.has_usable_password())
+        self.assertTrue(
+            Follow.objects.filter(user=reader, author=post.author).exists()
+        )
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(user=reader).values_list(
+                'post_id', flat=True
+            )),
+            [post.pk],
+        )
+        self.assertEqual(
+            [post_id for post_id, score in search_ids('кот')], [post.pk]
+        )
+
+    def test_jsonl(self):
+        output = self.round_trip(os.path.join(self.directory, 'data.jsonl'))
+        self.assertIn('post 2', output)
+        self.assert_restored()
+
+    def test_csv(self):
+        self.round_trip(os.path.join(self.directory, 'csv'), '--format', 'csv')
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory, 'csv', 'posts.csv'))
+        )
+        self.assert_restored()
+
+    def test_import_without_media_dir(self):
+        """Без каталога картинок импорт ссылается на файлы хранилища."""
+        path = os.path.join(self.directory, 'data.jsonl')
+        call_command('export_data', path, stderr=StringIO())
+        name = Post.objects.get(text='Старый пост про котов').image.name
+        # Удаление файла без ссылок откладывается до коммита.
+        User.objects.all().delete()
+        self.assertEqual(references(name), 0)
+        call_command('import_data', path, stdout=StringIO(),
+                     stderr=StringIO())
+        post = Post.objects.get(text='Старый пост про котов')
+        self.assertEqual(post.image.name, name)
+        self.assertEqual(references(name), 1)
+
+    def test_progress_report(self):
+        err = StringIO()
+        call_command(
+            'export_data', os.path.join(self.directory, 'data.jsonl'),
+            stderr=err,
+        )
+        self.assertIn('post: 2 строк', err.getvalue())
+        self.assertIn('строк/с', err.getvalue())
@@ -4,6 +4,7 @@ import tempfile
 from http import HTTPStatus
 
 from django.conf import settings
+from django.core.cache import cache
 from django.test import Client, TestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 
@@ -47,6 +48,8 @@ class PostUrlTest(TestCase):
             (f'/group/{cls.group.slug}/'): 'posts/group_list.html',
             (f'/profile/{cls.user.username}/'): 'posts/profile.html',
             (f'/posts/{cls.post.id}/'): 'posts/post_detail.html',
+            (f'/posts/{cls.post.id}/comments/'): (
+                'posts/includes/comments.html'),
         }
         cls.templates_authorized_url_access = {
             '/create/': 'posts/create_post.html',
@@ -62,6 +65,7 @@ class PostUrlTest(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
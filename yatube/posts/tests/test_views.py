@@ -3,15 +3,25 @@ import shutil
 import tempfile
 
 from django.core.paginator import Page
-from django.test import Client, TestCase, override_settings
+from django.http import HttpResponse
+from django.template import RequestContext, Template
+from django.test import (
+    AsyncClient, Client, RequestFactory, TestCase, override_settings
+)
 from django.urls import reverse
 from django import forms
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
 
-from ..models import Comment, Group, Post, User, Follow
+from ..models import (
+    AuthorStats, Comment, Group, Post, User, Follow, TimelineEntry
+)
+from ..cache import bump, cache_anonymous_page, cache_version
 from ..forms import CommentForm, PostForm
+from ..timeline import trim
+from ..utils import CachedCountPaginator, encode_cursor
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -70,6 +80,7 @@ class PostViewTest(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=False)
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -216,6 +227,7 @@ class FollowViewTest(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -313,16 +325,155 @@ class FollowViewTest(TestCase):
         )
         self.assertEqual(follow_count, Follow.objects.count())
 
+    def test_unfollow_removes_posts_from_follow_page(self):
+        """После отписки посты автора пропадают из ленты"""
+        follow = Follow.objects.create(
+            user=self.user_follower, author=self.user)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user_follower, post=self.post).exists())
+        follow.delete()
+        response = self.authorized_client_follower.get(reverse(
+            'posts:follow_index'))
+        self.assertNotIn(self.post, response.context['page_obj'])
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_fan_out_trims_timeline(self):
+        """Новый пост вытесняет из длинной ленты самую старую запись"""
+        Follow.objects.create(user=self.user_follower, author=self.user)
+        posts = [
+            Post.objects.create(text=f'Пост {number}', author=self.user)
+            for number in range(3)
+        ]
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(
+                user=self.user_follower
+            ).values_list('post', flat=True)),
+            [posts[2].pk, posts[1].pk],
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_posts_read_on_demand(self):
+        """Посты популярного автора не раздаются по лентам,
+        но попадают в ленту при чтении"""
+        Follow.objects.create(user=self.user_follower, author=self.user)
+        post_follow = Post.objects.create(
+            text=('Тестовый пост знаменитости'),
+            author=self.user,
+        )
+        self.assertFalse(TimelineEntry.objects.filter(
+            post=post_follow).exists())
+        response = self.authorized_client_follower.get(reverse(
+            'posts:follow_index'))
+        self.assertIn(post_follow, response.context['page_obj'])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_former_celebrity_posts_fanned_out(self):
+        """Автор, опустившийся ниже порога, раздает по лентам посты,
+        вышедшие, пока он был знаменитостью"""
+        Follow.objects.create(user=self.user_follower, author=self.user)
+        follow = Follow.objects.create(
+            user=self.user_no_follower, author=self.user)
+        self.assertIsNotNone(
+            AuthorStats.objects.get(user=self.user).celebrity_since)
+        post_follow = Post.objects.create(
+            text='Пост знаменитости', author=self.user)
+        self.assertFalse(TimelineEntry.objects.filter(
+            post=post_follow).exists())
+        follow.delete()
+        stats = AuthorStats.objects.get(user=self.user)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertIsNone(stats.celebrity_since)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user_follower, post=post_follow).exists())
+        response = self.authorized_client_follower.get(reverse(
+            'posts:follow_index'))
+        self.assertIn(post_follow, response.context['page_obj'])
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_trim_keeps_posts_with_same_date(self):
+        """Обрезка ленты не удаляет лишнего при равных датах"""
+        Follow.objects.create(user=self.user_follower, author=self.user)
+        posts = [
+            Post.objects.create(text=f'Пост {number}', author=self.user)
+            for number in range(3)
+        ]
+        TimelineEntry.objects.filter(user=self.user_follower).update(
+            pub_date=posts[0].pub_date)
+        TimelineEntry.objects.bulk_create([TimelineEntry(
+            user=self.user_follower, post=post, pub_date=posts[0].pub_date,
+        ) for post in posts], ignore_conflicts=True)
+        trim(self.user_follower.pk)
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(
+                user=self.user_follower
+            ).values_list('post', flat=True)),
+            [posts[2].pk, posts[1].pk],
+        )
+
     # Тестирование кэша
     def test_cache_index(self):
         response_cache = self.guest_client.get(reverse('posts:index'))
-        Post.objects.all().delete()
+        # update() не шлет сигналов, фрагмент остается в кэше
+        Post.objects.update(text='Текст без инвалидации')
         response = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(response_cache.content, response.content)
         cache.clear()
         response = self.guest_client.get(reverse('posts:index'))
         self.assertNotEqual(response_cache.content, response.content)
 
+    def test_cache_index_invalidated_on_delete(self):
+        """Удаление поста инвалидирует кэш главной страницы"""
+        response_cache = self.guest_client.get(reverse('posts:index'))
+        Post.objects.all().delete()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotEqual(response_cache.content, response.content)
+
+    def test_follow_keeps_other_cache(self):
+        """Подписка не сбрасывает кэш главной страницы"""
+        response_cache = self.guest_client.get(reverse('posts:index'))
+        Post.objects.update(text='Текст без инвалидации')
+        self.authorized_client_follower.post(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.user.username}))
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(response_cache.content, response.content)
+
+    def test_comment_updates_feed_counts(self):
+        """Комментарий обновляет счетчик в лентах и странице поста"""
+        Follow.objects.create(user=self.user_follower, author=self.user)
+        follow_url = reverse('posts:follow_index')
+        self.post.refresh_from_db()
+        count = f'Комментариев: {self.post.comments_count}'
+        index = self.guest_client.get(reverse('posts:index'))
+        follow = self.authorized_client_follower.get(follow_url)
+        self.assertContains(index, count)
+        self.assertContains(follow, count)
+        Comment.objects.create(
+            post=self.post, author=self.user_follower,
+            text='Свежий комментарий')
+        count = f'Комментариев: {self.post.comments_count + 1}'
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotEqual(response['ETag'], index['ETag'])
+        self.assertContains(response, count)
+        self.assertContains(
+            self.authorized_client_follower.get(follow_url), count
+        )
+        self.assertContains(
+            self.guest_client.get(reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.pk})),
+            'Свежий комментарий',
+        )
+
+    def test_cache_follow_invalidated_on_new_post(self):
+        """Новый пост автора инвалидирует кэш ленты подписчика"""
+        Follow.objects.create(user=self.user_follower, author=self.user)
+        url = reverse('posts:follow_index')
+        response_cache = self.authorized_client_follower.get(url)
+        Post.objects.create(text='Свежий пост для фолловера', author=self.user)
+        response = self.authorized_client_follower.get(url)
+        self.assertNotEqual(response_cache.content, response.content)
+        self.assertContains(response, 'Свежий пост для фолловера')
+
 
 class PaginatorViewsTest(TestCase):
     '''Тестирование paginator'''
@@ -349,6 +500,7 @@ class PaginatorViewsTest(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -369,3 +521,294 @@ class PaginatorViewsTest(TestCase):
                 response = self.guest_client.get((view + '?page=2'))
                 self.assertEqual(len(response.context['page_obj']),
                                  self.post_on_second_page)
+
+    @override_settings(KEYSET_PAGINATION=True)
+    def test_keyset_pages(self):
+        '''Курсорный paginator отдает страницы по ?after= и ?before='''
+        for view in self.urls:
+            with self.subTest(view=view):
+                response = self.guest_client.get(view)
+                first_page = response.context['page_obj']
+                self.assertEqual(len(first_page), settings.POST_ON_PAGE)
+                self.assertFalse(first_page.has_previous())
+                self.assertTrue(first_page.has_next())
+                response = self.guest_client.get(
+                    view, {'after': first_page.next_cursor})
+                second_page = response.context['page_obj']
+                self.assertEqual(len(second_page), self.post_on_second_page)
+                self.assertFalse(second_page.has_next())
+                self.assertTrue(second_page.has_previous())
+                self.assertFalse(
+                    set(first_page.object_list)
+                    & set(second_page.object_list))
+                response = self.guest_client.get(
+                    view, {'before': second_page.previous_cursor})
+                self.assertEqual(
+                    list(response.context['page_obj']),
+                    list(first_page))
+
+    @override_settings(POST_ON_PAGE=1)
+    def test_elided_page_range(self):
+        '''Навигация выводит края и окно вокруг текущей страницы'''
+        response = self.guest_client.get(reverse('posts:index'), {'page': 8})
+        page_obj = response.context['page_obj']
+        ellipsis = page_obj.paginator.ELLIPSIS
+        self.assertEqual(
+            page_obj.page_links,
+            [1, ellipsis, 6, 7, 8, 9, 10, ellipsis, 15]
+        )
+        self.assertNotContains(response, '?page=3"')
+        self.assertContains(response, '?page=15"')
+
+    @override_settings(PAGINATOR_CACHED_COUNT=True)
+    def test_cached_count(self):
+        '''Количество постов берется из кэша без COUNT(*)'''
+        posts = Post.objects.all()
+        CachedCountPaginator(posts, settings.POST_ON_PAGE).count
+        paginator = CachedCountPaginator(posts, settings.POST_ON_PAGE)
+        with self.assertNumQueries(0):
+            self.assertEqual(paginator.count, 15)
+        Post.objects.create(text='Новый пост', author=self.user)
+        paginator = CachedCountPaginator(
+            Post.objects.all(), settings.POST_ON_PAGE
+        )
+        self.assertEqual(paginator.count, 15)
+
+    @override_settings(PAGINATOR_CACHED_COUNT=True, PAGINATOR_COUNT_TIMEOUT=0)
+    def test_stale_count_refreshed_after_commit(self):
+        '''Устаревшее количество пересчитывается в фоне'''
+        paginator = CachedCountPaginator(
+            Post.objects.all(), settings.POST_ON_PAGE
+        )
+        self.assertEqual(paginator.count, 15)
+        paginator = CachedCountPaginator(
+            Post.objects.all(), settings.POST_ON_PAGE
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(paginator.count, 15)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_keyset_broken_cursor(self):
+        '''Битый курсор отдает первую страницу'''
+        pub_date = Post.objects.first().pub_date.isoformat()
+        for cursor in ('broken', encode_cursor([None, None]),
+                       encode_cursor([pub_date, None]),
+                       encode_cursor([pub_date, float('nan')])):
+            for name in ('after', 'before'):
+                with self.subTest(cursor=cursor, name=name):
+                    response = self.guest_client.get(
+                        reverse('posts:index'), {name: cursor})
+                    page_obj = response.context['page_obj']
+                    self.assertEqual(len(page_obj), settings.POST_ON_PAGE)
+                    self.assertFalse(page_obj.has_previous())
+
+
+@override_settings(COMMENTS_ON_PAGE=5)
+class CommentsPaginatorTest(TestCase):
+    '''Тестирование постраничной выдачи комментариев'''
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.post = Post.objects.create(text='Тестовый пост', author=cls.user)
+        cls.comments_on_second_page = 2
+        for i in range(5 + cls.comments_on_second_page):
+            Comment.objects.create(
+                text=f'Комментарий {i}',
+                post=cls.post,
+                author=cls.user,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_post_detail_first_comments(self):
+        '''post_detail выдает первую страницу комментариев'''
+        response = self.guest_client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id}))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 5)
+        self.assertEqual(comments[0].text, 'Комментарий 0')
+        self.assertTrue(comments.has_next())
+
+    def test_load_more_comments(self):
+        '''Фрагмент выдает комментарии после курсора'''
+        response = self.guest_client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id}))
+        cursor = response.context['comments'].next_cursor
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id}),
+            {'after': cursor})
+        comments = response.context['comments']
+        self.assertEqual(len(comments), self.comments_on_second_page)
+        self.assertFalse(comments.has_next())
+        self.assertContains(response, 'Комментарий 6')
+        self.assertNotContains(response, 'Комментарий 4')
+
+    def test_comments_query_count(self):
+        '''Комментарии выбираются одним запросом без join поста'''
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.id})
+        with self.assertNumQueries(2):
+            self.guest_client.get(url)
+
+    def test_comments_of_missing_post(self):
+        '''Фрагмент несуществующего поста отдает 404'''
+        response = self.guest_client.get(reverse(
+            'posts:post_comments', kwargs={'post_id': self.post.id + 100}))
+        self.assertEqual(response.status_code, 404)
+
+
+class FragmentCacheTest(TestCase):
+    '''Кэш фрагментов учитывает автора, читателя и правки'''
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_author')
+        cls.author_2 = User.objects.create_user(username='test_author_2')
+        cls.reader = User.objects.create_user(username='test_reader')
+        cls.reader_2 = User.objects.create_user(username='test_reader_2')
+        cls.group = Group.objects.create(
+            title='Старое название',
+            slug='test_slig',
+            description='Тест описание'
+        )
+        cls.post = Post.objects.create(
+            text='Пост первого автора', author=cls.author, group=cls.group)
+        cls.post_2 = Post.objects.create(
+            text='Пост второго автора', author=cls.author_2)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Follow.objects.create(user=cls.reader_2, author=cls.author_2)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.reader_2_client = Client()
+        self.reader_2_client.force_login(self.reader_2)
+
+    def test_profile_fragment_per_author(self):
+        '''Профили разных авторов не делят фрагмент'''
+        self.guest_client.get(reverse(
+            'posts:profile', kwargs={'username': self.author.username}))
+        response = self.guest_client.get(reverse(
+            'posts:profile', kwargs={'username': self.author_2.username}))
+        self.assertContains(response, self.post_2.text)
+        self.assertNotContains(response, self.post.text)
+
+    def test_follow_fragment_per_user(self):
+        '''Ленты подписок разных читателей не делят фрагмент'''
+        self.reader_client.get(reverse('posts:follow_index'))
+        response = self.reader_2_client.get(reverse('posts:follow_index'))
+        self.assertContains(response, self.post_2.text)
+        self.assertNotContains(response, self.post.text)
+
+    def test_group_rename_invalidates_fragments(self):
+        '''Переименование группы инвалидирует фрагменты лент'''
+        url = reverse(
+            'posts:profile', kwargs={'username': self.author.username})
+        self.assertContains(self.guest_client.get(url), 'Старое название')
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertContains(self.guest_client.get(url), 'Новое название')
+
+
+class AnonymousPageCacheTest(TestCase):
+    '''Кэш страниц для анонимных пользователей и условные GET'''
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.post = Post.objects.create(text='Тестовый пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:profile',
+                    kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
+
+    def test_not_modified(self):
+        '''Повторный запрос с If-None-Match получает 304'''
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertTrue(response.has_header('Last-Modified'))
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_page_served_from_cache(self):
+        '''Страница отдается из кэша без отрисовки шаблонов'''
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.guest_client.get(url)
+                self.assertTrue(first.templates)
+                second = self.guest_client.get(url)
+                self.assertFalse(second.templates)
+                self.assertEqual(first.content, second.content)
+
+    def test_write_changes_etag(self):
+        '''Новый пост меняет ETag главной страницы'''
+        url = reverse('posts:index')
+        etag = self.guest_client.get(url)['ETag']
+        Post.objects.create(text='Новый пост', author=self.user)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый пост')
+
+    def test_authorized_not_cached(self):
+        '''Страницы авторизованных пользователей не кэшируются'''
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertNotContains(self.guest_client.get(
+            reverse('posts:index')), self.user.username + '</a>')
+
+    def test_versions_never_repeat(self):
+        '''Каждая инвалидация и вытеснение дают новую версию'''
+        seen = {cache_version(('feed',))}
+        for _ in range(3):
+            bump(('feed',))
+            seen.add(cache_version(('feed',)))
+            cache.clear()
+            seen.add(cache_version(('feed',)))
+        self.assertEqual(len(seen), 7)
+
+    def test_form_page_not_cached(self):
+        '''Страница с CSRF-токеном в форме не кэшируется'''
+        rendered = []
+
+        @cache_anonymous_page(lambda: [('feed',)])
+        def form_page(request):
+            rendered.append(request)
+            template = Template(
+                '<form method="post">{% csrf_token %}</form>'
+            )
+            return HttpResponse(template.render(RequestContext(request)))
+
+        factory = RequestFactory()
+        for _ in range(2):
+            request = factory.get('/form/')
+            request.user = AnonymousUser()
+            response = form_page(request)
+            self.assertContains(response, 'csrfmiddlewaretoken')
+            self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(len(rendered), 2)
+
+    async def test_asgi_not_modified(self):
+        '''Асинхронные представления под ASGI отдают 304 из кэша'''
+        client = AsyncClient()
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = await client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Тестовый пост')
+                response = await client.get(
+                    url, headers={'If-None-Match': response['ETag']})
+                self.assertEqual(response.status_code, 304)
@@ -0,0 +1,232 @@
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from . import cache as versions
+from .models import AuthorStats, Follow, Post, TimelineEntry
+
+TIMELINE_ORDERING = ('-pub_date', '-post_id')
+# Пост, созданный перед переходом порога, мог проверить статус
+# автора уже после него и тоже не попасть в ленты.
+CELEBRITY_SLACK = datetime.timedelta(minutes=1)
+
+
+def is_celebrity(author_id):
+    '''Автор с огромным числом подписчиков: его посты не раздаются
+    по лентам при записи, а подмешиваются при чтении'''
+    return AuthorStats.objects.filter(
+        user_id=author_id, celebrity_since__isnull=False
+    ).exists()
+
+
+def update_celebrity(author_id):
+    '''Сверяет статус знаменитости со счетчиком подписчиков.
+
+    Автор, опустившийся до TIMELINE_FANOUT_LIMIT, раздает по лентам
+    посты, вышедшие, пока он был знаменитостью: иначе они пропали бы
+    из лент вместе с подмешиванием при чтении.
+    '''
+    stats = AuthorStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', 'celebrity_since'
+    ).first()
+    if stats is None:
+        return
+    followers, since = stats
+    if followers > settings.TIMELINE_FANOUT_LIMIT and since is None:
+        AuthorStats.objects.filter(
+            user_id=author_id, celebrity_since__isnull=True
+        ).update(celebrity_since=timezone.now())
+    elif followers <= settings.TIMELINE_FANOUT_LIMIT and since is not None:
+        # Статус снимается до раздачи: пост, вышедший между ними,
+        # разложит fan_out_post. Раздает тот, кто снял статус.
+        demoted = AuthorStats.objects.filter(
+            user_id=author_id, celebrity_since=since
+        ).update(celebrity_since=None)
+        if demoted:
+            posts = Post.objects.filter(
+                author_id=author_id, pub_date__gte=since - CELEBRITY_SLACK
+            ).order_by('-pub_date', '-id').values_list(
+                'id', 'pub_date'
+            )[:settings.TIMELINE_LENGTH]
+            fan_out(author_id, list(posts))
+
+
+def fan_out(author_id, posts):
+    '''Раскладывает посты автора, пары (id, pub_date), по лентам
+    подписчиков'''
+    if not posts:
+        return
+    followers = list(Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True))
+    size = settings.TIMELINE_BATCH_SIZE
+    for start in range(0, len(followers), size):
+        batch = followers[start:start + size]
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    user_id=user_id, post_id=post_id, pub_date=pub_date
+                )
+                for user_id in batch
+                for post_id, pub_date in posts
+            ],
+            batch_size=size,
+            ignore_conflicts=True,
+        )
+        # Обрезаются только ленты, которые стали длиннее предела.
+        overflowing = TimelineEntry.objects.filter(
+            user_id__in=batch
+        ).order_by().values('user_id').annotate(
+            entries=Count('post_id')
+        ).filter(entries__gt=settings.TIMELINE_LENGTH).values_list(
+            'user_id', flat=True
+        )
+        for user_id in overflowing:
+            trim(user_id)
+
+
+def fan_out_post(post):
+    '''Раскладывает новый пост по лентам подписчиков автора'''
+    if not is_celebrity(post.author_id):
+        fan_out(post.author_id, [(post.pk, post.pub_date)])
+
+
+def backfill(user_id, author_id):
+    '''Добавляет в ленту последние посты автора после подписки.
+
+    Посты знаменитостей тоже: если автор опустится ниже порога,
+    раздавать придется только посты, вышедшие за время его славы.
+    '''
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date'
+    )[:settings.TIMELINE_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts
+        ],
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(user_id)
+
+
+def remove_author(user_id, author_id):
+    '''Убирает из ленты посты автора после отписки'''
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def trim(user_id):
+    '''Обрезает ленту до TIMELINE_LENGTH самых свежих записей'''
+    boundary = TimelineEntry.objects.filter(user_id=user_id).order_by(
+        *TIMELINE_ORDERING
+    ).values_list(
+        'pub_date', 'post_id'
+    )[settings.TIMELINE_LENGTH:settings.TIMELINE_LENGTH + 1]
+    boundary = list(boundary)
+    if boundary:
+        # Граница по (pub_date, post_id): записи с той же датой,
+        # что у границы, но свежее ее, остаются в ленте.
+        pub_date, post_id = boundary[0]
+        TimelineEntry.objects.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, post_id__lte=post_id),
+            user_id=user_id,
+        ).delete()
+
+
+def rebuild(user_id):
+    '''Пересобирает ленту пользователя с нуля'''
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    authors = Follow.objects.filter(user_id=user_id).values_list(
+        'author_id', flat=True
+    )
+    for author_id in authors:
+        backfill(user_id, author_id)
+
+
+def rebuild_all():
+    '''Пересобирает все ленты одним проходом по подпискам: для
+    загруженных пачками данных, где по одной ленте слишком долго'''
+    TimelineEntry.objects.all().delete()
+    entries = Follow.objects.filter(author__posts__isnull=False).annotate(
+        entry_post=F('author__posts__id'),
+        entry_date=F('author__posts__pub_date'),
+        rank=Window(
+            RowNumber(),
+            partition_by=F('user_id'),
+            order_by=(
+                F('author__posts__pub_date').desc(),
+                F('author__posts__id').desc(),
+            ),
+        ),
+    ).filter(rank__lte=settings.TIMELINE_LENGTH).order_by().values_list(
+        'user_id', 'entry_post', 'entry_date'
+    )
+    batch = []
+    for user_id, post_id, pub_date in entries.iterator(
+            chunk_size=settings.TIMELINE_BATCH_SIZE):
+        batch.append(
+            TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        )
+        if len(batch) == settings.TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def followed_authors(user):
+    '''Авторы, на которых подписан пользователь, и знаменитости
+    среди них - одним запросом'''
+    follows = Follow.objects.filter(user=user).order_by(
+        'author_id'
+    ).values_list('author_id', 'author__stats__celebrity_since')
+    authors, celebrities = [], []
+    for author_id, celebrity_since in follows:
+        authors.append(author_id)
+        if celebrity_since is not None:
+            celebrities.append(author_id)
+    return authors, celebrities
+
+
+def timeline_scopes(user, authors):
+    '''Поколения ленты: поколение самой ленты и авторов подписок'''
+    return [
+        ('timeline', user.pk),
+        *(('author', author_id) for author_id in authors),
+    ]
+
+
+def timeline_version(user, authors):
+    '''Версия ленты: поколение ленты и поколения авторов подписок.
+
+    Пост поднимает одно поколение своего автора, а ленты подписчиков
+    читают его при отрисовке: запись не обходит всех подписчиков.
+    '''
+    version = versions.cache_version(*timeline_scopes(user, authors))
+    # Подписок может быть много, а версия входит в ключ кэша.
+    return hashlib.md5(version.encode()).hexdigest()
+
+
+def timeline_entries(user):
+    '''Записи ленты: диапазон по индексу (user, -pub_date, -post)'''
+    return TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    )
+
+
+def timeline_posts(user, celebrities):
+    '''Посты ленты подписок: материализованная лента плюс посты
+    авторов-знаменитостей, которые читаются напрямую'''
+    if not celebrities:
+        return Post.objects.filter(timeline_entries__user=user)
+    entries = TimelineEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(
+        Q(id__in=entries) | Q(author_id__in=celebrities)
+    )
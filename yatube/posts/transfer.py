@@ -0,0 +1,342 @@
+import csv
+import json
+import os
+import shutil
+import time
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import storage
+from core.models import keep_dates
+
+from . import cache as versions
+from . import counters, search, timeline
+from .models import Comment, Follow, Group, Post, User
+
+# Порядок важен: записи ссылаются на предыдущие модели.
+MODELS = ('group', 'post', 'comment', 'follow')
+FIELDS = {
+    'group': ('id', 'title', 'slug', 'description'),
+    'post': ('id', 'text', 'pub_date', 'author', 'group', 'image'),
+    'comment': ('id', 'post', 'author', 'text', 'pub_date'),
+    'follow': ('user', 'author'),
+}
+EXPORTS = {
+    'group': lambda: Group.objects.order_by('id').values_list(
+        'id', 'title', 'slug', 'description'
+    ),
+    'post': lambda: Post.objects.order_by('id').values_list(
+        'id', 'text', 'pub_date', 'author__username', 'group__slug', 'image'
+    ),
+    'comment': lambda: Comment.objects.order_by('id').values_list(
+        'id', 'post_id', 'author__username', 'text', 'pub_date'
+    ),
+    'follow': lambda: Follow.objects.order_by('id').values_list(
+        'user__username', 'author__username'
+    ),
+}
+
+
+class Progress:
+    """Пишет в поток число обработанных строк и скорость."""
+
+    def __init__(self, stream, interval=1.0):
+        self.stream = stream
+        self.interval = interval
+        self.rows = Counter()
+        self.started = self.reported = time.perf_counter()
+
+    def tick(self, model, rows=1):
+        self.rows[model] += rows
+        now = time.perf_counter()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.stream.write(self.line(model, now))
+
+    def rate(self, rows, now=None):
+        elapsed = (now or time.perf_counter()) - self.started
+        return rows / elapsed if elapsed else 0.0
+
+    def line(self, model, now=None):
+        rows = self.rows[model]
+        return f'{model}: {rows} строк, {self.rate(rows, now):.0f} строк/с'
+
+    def summary(self):
+        total = sum(self.rows.values())
+        return (
+            f'Всего {total} строк за '
+            f'{time.perf_counter() - self.started:.1f} с, '
+            f'{self.rate(total):.0f} строк/с'
+        )
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def export_records(model, batch_size):
+    '''Записи модели словарями, память не растет с размером таблицы'''
+    fields = FIELDS[model]
+    for values in EXPORTS[model]().iterator(chunk_size=batch_size):
+        yield dict(zip(fields, map(_text, values)))
+
+
+def copy_image_out(name, media_dir):
+    target = os.path.join(media_dir, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with default_storage.open(name) as source, open(target, 'wb') as out:
+        shutil.copyfileobj(source, out)
+
+
+def write_jsonl(stream, models, batch_size, progress, media_dir=None):
+    for model in models:
+        for record in export_records(model, batch_size):
+            if media_dir and record.get('image'):
+                copy_image_out(record['image'], media_dir)
+            stream.write(json.dumps(
+                {'model': model, **record}, ensure_ascii=False
+            ))
+            stream.write('\n')
+            progress.tick(model)
+
+
+def write_csv(directory, models, batch_size, progress, media_dir=None):
+    os.makedirs(directory, exist_ok=True)
+    for model in models:
+        path = os.path.join(directory, f'{model}s.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            writer = csv.DictWriter(stream, FIELDS[model])
+            writer.writeheader()
+            for record in export_records(model, batch_size):
+                if media_dir and record.get('image'):
+                    copy_image_out(record['image'], media_dir)
+                writer.writerow(record)
+                progress.tick(model)
+
+
+def read_jsonl(stream):
+    for line in stream:
+        if line.strip():
+            record = json.loads(line)
+            yield record.pop('model'), record
+
+
+def read_csv(directory):
+    for model in MODELS:
+        path = os.path.join(directory, f'{model}s.csv')
+        if not os.path.exists(path):
+            continue
+        with open(path, newline='', encoding='utf-8') as stream:
+            for record in csv.DictReader(stream):
+                yield model, record
+
+
+def _date(value):
+    return parse_datetime(value) if value else timezone.now()
+
+
+class Importer:
+    """Загружает записи пачками через bulk_create.
+
+    Внешние ключи разрешаются по словарям в памяти: имя пользователя,
+    слаг группы и id поста в исходных данных -> id в базе. Недостающие
+    пользователи и группы создаются. Сигналы при bulk_create не
+    срабатывают, поэтому finish() пересчитывает счетчики, ленты,
+    поисковый индекс и версии кэша.
+    """
+
+    def __init__(self, batch_size=1000, media_dir=None, progress=None):
+        self.batch_size = batch_size
+        self.media_dir = media_dir
+        self.progress = progress
+        self.users = {}
+        self.groups = {}
+        self.posts = {}
+        self.pending = {model: [] for model in MODELS}
+        self.created = Counter()
+        self.skipped = Counter()
+        self.authors = set()
+        self.followers = set()
+        self.unusable_password = make_password(None)
+
+    def add(self, model, record):
+        if model not in self.pending:
+            self.skipped[model] += 1
+            return
+        batch = self.pending[model]
+        batch.append(record)
+        if len(batch) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model=MODELS[-1]):
+        '''Записывает пачки модели и всех моделей, на которые она
+        ссылается'''
+        for name in MODELS[:MODELS.index(model) + 1]:
+            batch = self.pending[name]
+            if batch:
+                self.pending[name] = []
+                getattr(self, f'create_{name}s')(batch)
+                if self.progress:
+                    self.progress.tick(name, len(batch))
+
+    def user_ids(self, usernames):
+        missing = set(usernames) - self.users.keys()
+        if missing:
+            self.users.update(
+                User.objects.filter(username__in=missing).values_list(
+                    'username', 'id'
+                )
+            )
+            users = [
+                User(username=username, password=self.unusable_password)
+                for username in missing - self.users.keys()
+            ]
+            User.objects.bulk_create(users)
+            self.users.update((user.username, user.pk) for user in users)
+            self.created['user'] += len(users)
+        return self.users
+
+    def create_groups(self, records):
+        slugs = {record['slug'] for record in records}
+        self.groups.update(
+            Group.objects.filter(slug__in=slugs).values_list('slug', 'id')
+        )
+        groups = []
+        for record in records:
+            if record['slug'] in self.groups:
+                self.skipped['group'] += 1
+                continue
+            group = Group(
+                title=record['title'],
+                slug=record['slug'],
+                description=record['description'],
+            )
+            # Пустой id - заглушка от повторов слага в одной пачке.
+            self.groups[group.slug] = None
+            groups.append(group)
+        Group.objects.bulk_create(groups)
+        self.groups.update((group.slug, group.pk) for group in groups)
+        self.created['group'] += len(groups)
+
+    def group_ids(self, slugs):
+        missing = set(slugs) - self.groups.keys()
+        if missing:
+            self.groups.update(
+                Group.objects.filter(slug__in=missing).values_list(
+                    'slug', 'id'
+                )
+            )
+        return self.groups
+
+    def copy_image_in(self, name):
+        if not name:
+            return ''
+        if not self.media_dir:
+            # Файл уже в хранилище: пост добавляет на него ссылку, как
+            # save() при копировании.
+            storage.acquire(name)
+            return name
+        path = os.path.join(self.media_dir, name)
+        if not os.path.exists(path):
+            self.skipped['image'] += 1
+            return ''
+        with open(path, 'rb') as source:
+            return default_storage.save(name, File(source))
+
+    def create_posts(self, records):
+        users = self.user_ids(record['author'] for record in records)
+        groups = self.group_ids(
+            record['group'] for record in records if record['group']
+        )
+        posts = [
+            Post(
+                text=record['text'],
+                pub_date=_date(record['pub_date']),
+                author_id=users[record['author']],
+                group_id=groups.get(record['group']),
+                image=self.copy_image_in(record['image']),
+            )
+            for record in records
+        ]
+        with keep_dates(Post, 'pub_date'):
+            Post.objects.bulk_create(posts)
+        for record, post in zip(records, posts):
+            self.posts[str(record['id'])] = post.pk
+            self.authors.add(post.author_id)
+        search.get_index().index_many((post.pk, post.text) for post in posts)
+        self.created['post'] += len(posts)
+
+    def create_comments(self, records):
+        users = self.user_ids(record['author'] for record in records)
+        comments = []
+        for record in records:
+            post_id = self.posts.get(str(record['post']))
+            if post_id is None:
+                self.skipped['comment'] += 1
+                continue
+            comments.append(Comment(
+                text=record['text'],
+                pub_date=_date(record['pub_date']),
+                author_id=users[record['author']],
+                post_id=post_id,
+            ))
+        with keep_dates(Comment, 'pub_date'):
+            Comment.objects.bulk_create(comments)
+        self.created['comment'] += len(comments)
+
+    def create_follows(self, records):
+        users = self.user_ids(
+            username for record in records
+            for username in (record['user'], record['author'])
+        )
+        follows = []
+        for record in records:
+            if record['user'] == record['author']:
+                self.skipped['follow'] += 1
+                continue
+            follows.append(Follow(
+                user_id=users[record['user']],
+                author_id=users[record['author']],
+            ))
+            self.followers.add(users[record['user']])
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        self.created['follow'] += len(follows)
+
+    def finish(self):
+        '''Дописывает пачки и восстанавливает производные данные'''
+        self.flush()
+        readers = set(self.followers)
+        authors = list(self.authors)
+        for start in range(0, len(authors), self.batch_size):
+            readers.update(Follow.objects.filter(
+                author_id__in=authors[start:start + self.batch_size]
+            ).values_list('user_id', flat=True))
+        rebuild_derived(readers)
+
+
+def rebuild_derived(readers=None):
+    '''Восстанавливает то, что при bulk_create делают сигналы: счетчики,
+    ленты читателей (None - всех) и версии кэша'''
+    counters.reconcile()
+    if readers is None:
+        timeline.rebuild_all()
+        # Поколение всех лент разом не сменить, поэтому меняются
+        # общие поколения, входящие в каждую версию.
+        versions.bump(('feed',), ('groups',), ('users',))
+        return
+    for user_id in readers:
+        timeline.rebuild(user_id)
+    # Новые пользователи и группы меняют все ленты разом.
+    versions.bump(
+        ('feed',), ('groups',), ('users',),
+        *(('timeline', user_id) for user_id in readers),
+    )
@@ -1,10 +1,290 @@
+import base64
+import datetime
+import hashlib
+import json
+import logging
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
 from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+KEYSET_ORDERING = ('-pub_date', '-id')
+COMMENTS_ORDERING = ('pub_date', 'id')
+COUNT_KEY = 'paginator:count:{digest}'
+COUNT_LOCK_KEY = 'paginator:count-lock:{digest}'
+
+_executor = None
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    '''DjangoJSONEncoder обрезает время до миллисекунд, курсору нужны все
+    микросекунды, иначе сравнение на границе страницы теряет строки'''
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    '''Упаковывает значения ключа сортировки в строку для URL'''
+    raw = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    '''Распаковывает курсор, для битого курсора возвращает None'''
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(values, list):
+        return None
+    return values
+
+
+class KeysetPage(Sequence):
+    '''Страница курсорного пагинатора.
+
+    Повторяет интерфейс django.core.paginator.Page, который использует
+    шаблон paginator.html. Номера страниц в курсорном режиме неизвестны,
+    поэтому number - это курсор, которым выбрана страница: он нужен
+    как ключ для кэша фрагментов.
+    '''
+
+    def __init__(self, object_list, paginator, number,
+                 has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.number = number
+        self._has_next = has_next
+        self._has_previous = has_previous
+        # Курсоры считаются сразу: object_list можно подменить
+        # (например, записи ленты на их посты).
+        self.next_cursor = None
+        self.previous_cursor = None
+        if object_list and has_next:
+            self.next_cursor = paginator.cursor_for(object_list[-1])
+        if object_list and has_previous:
+            self.previous_cursor = paginator.cursor_for(object_list[0])
+
+    def __repr__(self):
+        return f'<KeysetPage {self.number or "first"}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class KeysetPaginator:
+    '''Пагинация по ключу сортировки вместо COUNT(*) и OFFSET.
 
+    Страница выбирается условием "строго после/до курсора" по паре
+    полей ordering, поэтому стоимость запроса не зависит от глубины
+    страницы, а общее количество объектов не считается.
+    '''
+    keyset = True
 
-def get_paginator_pages(posts, request):
+    def __init__(self, object_list, per_page, ordering=KEYSET_ORDERING):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip('-') for field in self.ordering)
+        self.descending = self.ordering[0].startswith('-')
+
+    def cursor_for(self, obj):
+        if isinstance(obj, dict):
+            return encode_cursor([obj[field] for field in self.fields])
+        return encode_cursor([getattr(obj, field) for field in self.fields])
+
+    def _parse(self, cursor):
+        values = decode_cursor(cursor) if cursor else None
+        if values is None or len(values) != len(self.fields):
+            return None
+        model = self.object_list.model
+        try:
+            values = [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except Exception:
+            return None
+        # null проходит to_python, но не сравнивается в _seek().
+        if any(value is None or value != value for value in values):
+            return None
+        return values
+
+    def _seek(self, values, forward):
+        '''Условие "после курсора" по направлению обхода.'''
+        lookup = 'lt' if forward == self.descending else 'gt'
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.fields, values):
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def _reversed_ordering(self):
+        return tuple(
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        )
+
+    def filter_after(self, cursor):
+        '''Все объекты после курсора по порядку, без деления на страницы'''
+        values = self._parse(cursor)
+        queryset = self.object_list
+        if values:
+            queryset = queryset.filter(self._seek(values, True))
+        return queryset.order_by(*self.ordering)
+
+    def get_page(self, after=None, before=None):
+        after_values = self._parse(after)
+        before_values = None if after_values else self._parse(before)
+        queryset = self.object_list
+        if before_values:
+            queryset = queryset.filter(self._seek(before_values, False))
+            rows = list(
+                queryset.order_by(*self._reversed_ordering())
+                [:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(rows, self, f'before:{before}',
+                              has_next=True, has_previous=has_previous)
+        if after_values:
+            queryset = queryset.filter(self._seek(after_values, True))
+        rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+        return KeysetPage(
+            rows[:self.per_page],
+            self,
+            f'after:{after}' if after_values else '',
+            has_next=len(rows) > self.per_page,
+            has_previous=bool(after_values),
+        )
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='paginator-count'
+        )
+    return _executor
+
+
+def refresh_count(queryset, digest):
+    '''Пересчитывает количество объектов и кладет его в кэш'''
+    try:
+        cache.set(
+            COUNT_KEY.format(digest=digest),
+            (queryset.count(), time.time()),
+            None,
+        )
+    finally:
+        cache.delete(COUNT_LOCK_KEY.format(digest=digest))
+
+
+def _refresh_in_worker(queryset, digest):
+    try:
+        refresh_count(queryset, digest)
+    except Exception:
+        logger.exception('Не удалось пересчитать количество объектов')
+    finally:
+        close_old_connections()
+
+
+class CachedCountPaginator(Paginator):
+    '''Paginator без COUNT(*) в каждом запросе.
+
+    Количество объектов берется из кэша. Если оно старше
+    PAGINATOR_COUNT_TIMEOUT секунд, страница строится по старому
+    значению, а пересчет уходит в фоновый поток. Номер последней
+    страницы при этом может ненадолго разойтись с данными.
+    '''
+
+    @cached_property
+    def digest(self):
+        sql, params = self.object_list.query.sql_with_params()
+        return hashlib.md5(repr((sql, params)).encode()).hexdigest()
+
+    @cached_property
+    def count(self):
+        cached = cache.get(COUNT_KEY.format(digest=self.digest))
+        if cached is None:
+            refresh_count(self.object_list, self.digest)
+            cached = cache.get(COUNT_KEY.format(digest=self.digest))
+            if cached is None:
+                return self.object_list.count()
+        count, refreshed = cached
+        stale = time.time() - refreshed > settings.PAGINATOR_COUNT_TIMEOUT
+        # Блокировка не дает нескольким запросам пересчитывать разом.
+        if stale and cache.add(
+                COUNT_LOCK_KEY.format(digest=self.digest), True,
+                settings.PAGINATOR_COUNT_TIMEOUT):
+            queryset, digest = self.object_list, self.digest
+            transaction.on_commit(
+                lambda: get_executor().submit(
+                    _refresh_in_worker, queryset, digest
+                )
+            )
+        return count
+
+
+def get_page_links(page_obj):
+    '''Номера страниц для навигации: первые, последние и окно вокруг
+    текущей, пропуски - Paginator.ELLIPSIS'''
+    return list(page_obj.paginator.get_elided_page_range(
+        page_obj.number,
+        on_each_side=settings.PAGINATOR_ON_EACH_SIDE,
+        on_ends=settings.PAGINATOR_ON_ENDS,
+    ))
+
+
+def get_paginator_pages(posts, request, keyset=None,
+                        ordering=KEYSET_ORDERING):
     '''Получает posts и request, возвращает пагинатор с текущей страницей'''
-    paginator = Paginator(posts, settings.POST_ON_PAGE)
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if keyset is None:
+        keyset = settings.KEYSET_PAGINATION or bool(after or before)
+    if keyset:
+        paginator = KeysetPaginator(posts, settings.POST_ON_PAGE, ordering)
+        return paginator.get_page(after=after, before=before)
+    paginator_class = Paginator
+    if settings.PAGINATOR_CACHED_COUNT:
+        paginator_class = CachedCountPaginator
+    paginator = paginator_class(posts, settings.POST_ON_PAGE)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    page_obj.page_links = get_page_links(page_obj)
     return page_obj
+
+
+def get_comments_page(comments, cursor):
+    '''Страница комментариев от старых к новым после курсора'''
+    paginator = KeysetPaginator(
+        comments, settings.COMMENTS_ON_PAGE, ordering=COMMENTS_ORDERING
+    )
+    return paginator.get_page(after=cursor)
@@ -1,75 +1,203 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.decorators import login_required
-from django.core.cache import cache
 
-from .models import Group, Post, User, Follow
+from core.concurrency import run_concurrently
+from core.routers import pin_primary
+from core.uploads import upload_error
+
+from . import outbox
+from .cache import cache_anonymous_page, cache_version, fresh_reads
+from .models import Comment, Group, Post, User, Follow
 from .forms import CommentForm, PostForm
-from .utils import get_paginator_pages
+from .images import THUMBNAILS, schedule_variants
+from .search import search_posts
+from .timeline import (
+    TIMELINE_ORDERING, followed_authors, timeline_entries, timeline_posts,
+    timeline_scopes, timeline_version
+)
+from .utils import get_comments_page, get_paginator_pages
+
+
+def feed_scopes():
+    return [('feed',)]
+
+
+def group_scopes(slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True
+    ).first()
+    return group_id and [('group', group_id)]
 
 
-def index(request):
+def profile_scopes(username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    return author_id and [('author', author_id)]
+
+
+def detail_scopes(post_id):
+    author_id = Post.objects.filter(id=post_id).values_list(
+        'author_id', flat=True
+    ).first()
+    return author_id and [('post', post_id), ('author', author_id)]
+
+
+@cache_anonymous_page(feed_scopes)
+async def index(request):
     posts = Post.objects.select_related('group', 'author')
-    page_obj = get_paginator_pages(posts, request)
+    # Версия читается до постов: запись между ними сменит версию,
+    # и устаревший фрагмент не попадет в кэш под новой.
+    version = await sync_to_async(cache_version)(('feed',))
+    page_obj = await sync_to_async(get_paginator_pages)(posts, request)
     template = 'posts/index.html'
     context = {
         'page_obj': page_obj,
+        'cache_version': version,
     }
-    return render(request, template, context)
+    return await sync_to_async(render)(request, template, context)
 
 
-def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author', 'group')
-    page_obj = get_paginator_pages(posts, request)
+@cache_anonymous_page(group_scopes)
+async def group_posts(request, slug):
+    posts = Post.objects.filter(group__slug=slug).select_related(
+        'author', 'group'
+    )
+    group, page_obj = await run_concurrently(
+        partial(get_object_or_404, Group, slug=slug),
+        partial(get_paginator_pages, posts, request),
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
     }
     template = 'posts/group_list.html'
-    return render(request, template, context)
+    return await sync_to_async(render)(request, template, context)
 
 
-def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related('author', 'group')
-    following = (
-        request.user.is_authenticated
-        and request.user != author
-        and Follow.objects.filter(user=request.user, author=author)
+def get_author(username):
+    author = get_object_or_404(
+        User.objects.select_related('stats'),
+        username=username
+    )
+    return author, cache_version(('author', author.pk))
+
+
+def is_following(user, username):
+    return (
+        user.is_authenticated
+        and user.username != username
+        and Follow.objects.filter(
+            user=user, author__username=username
+        ).exists()
     )
-    page_obj = get_paginator_pages(posts, request)
+
+
+@cache_anonymous_page(profile_scopes)
+async def profile(request, username):
+    posts = Post.objects.filter(author__username=username).select_related(
+        'author', 'group'
+    )
+    # Версия автора читается до постов, как в index.
+    (author, version), following = await run_concurrently(
+        partial(get_author, username),
+        partial(is_following, request.user, username),
+    )
+    page_obj = await sync_to_async(get_paginator_pages)(posts, request)
+    if settings.WRITE_BEHIND:
+        following = await sync_to_async(outbox.pending_following)(
+            request.user, author.pk, following
+        )
     template = 'posts/profile.html'
     context = {
         'page_obj': page_obj,
         'author': author,
         'following': following,
+        'cache_version': version,
     }
-    return render(request, template, context)
+    return await sync_to_async(render)(request, template, context)
 
 
-def post_detail(request, post_id):
-    post = get_object_or_404(
-        Post.objects.select_related(
-            'author',
-            'group'
+@cache_anonymous_page(detail_scopes)
+async def post_detail(request, post_id):
+    post, comments, pending_comments = await run_concurrently(
+        partial(
+            get_object_or_404,
+            Post.objects.select_related('author', 'author__stats', 'group'),
+            id=post_id
+        ),
+        partial(
+            get_comments_page,
+            post_comments_queryset(post_id),
+            request.GET.get('comments_after')
         ),
-        id=post_id
+        partial(outbox.pending_comments, request.user, post_id),
     )
-    comments = post.comments.select_related('author', 'post')
     template = 'posts/post_detail.html'
     form = CommentForm()
     context = {
         'post': post,
         'form': form,
         'comments': comments,
+        'pending_comments': pending_comments,
+    }
+    return await sync_to_async(render)(request, template, context)
+
+
+def post_comments_queryset(post_id):
+    return Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    ).only('id', 'text', 'pub_date', 'post', 'author__username')
+
+
+def post_comments(request, post_id):
+    if not Post.objects.filter(id=post_id).exists():
+        raise Http404
+    comments = get_comments_page(
+        post_comments_queryset(post_id),
+        request.GET.get('after')
+    )
+    template = 'posts/includes/comments.html'
+    context = {
+        'comments': comments,
+        'post_id': post_id,
+    }
+    return render(request, template, context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = query and search_posts(query, request.GET.get('after'))
+    template = 'posts/search.html'
+    context = {
+        'query': query,
+        'page_obj': page_obj,
     }
     return render(request, template, context)
 
 
+def post_form(request, instance=None):
+    '''Форма поста. Прерванная загрузка файла тоже показывается
+    формой: в этом случае request.FILES пуст'''
+    if request.method != 'POST':
+        return PostForm(instance=instance)
+    return PostForm(
+        request.POST,
+        files=request.FILES,
+        instance=instance,
+        upload_error=upload_error(request),
+    )
+
+
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = post_form(request)
     context = {
         'form': form,
     }
@@ -78,6 +206,9 @@ def post_create(request):
     new_post = form.save(commit=False)
     new_post.author = request.user
     new_post.save()
+    pin_primary(request)
+    if new_post.image:
+        schedule_variants(new_post)
     return redirect('posts:profile', request.user)
 
 
@@ -87,17 +218,20 @@ def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     if request.user != post.author:
         return redirect('posts:post_detail', post_id)
-    form = PostForm(
-        request.POST or None,
-        files=request.FILES or None,
-        instance=post)
+    form = post_form(request, instance=post)
     if not form.is_valid():
         context = {
             'form': form,
         }
         return render(request, template, context)
+    if 'image' in form.changed_data:
+        for field in THUMBNAILS:
+            setattr(post, field, '')
+        post.variants = {}
     form.save()
-    cache.clear()
+    pin_primary(request)
+    if 'image' in form.changed_data:
+        schedule_variants(post)
     return redirect('posts:post_detail', post_id)
 
 
@@ -105,37 +239,63 @@ def post_edit(request, post_id):
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
-    if form.is_valid():
+    if form.is_valid() and settings.WRITE_BEHIND:
+        outbox.add_comment(request.user, post.pk, form.cleaned_data['text'])
+    elif form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
         comment.save()
+        pin_primary(request)
     return redirect('posts:post_detail', post_id)
 
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_paginator_pages(posts, request)
-    template = 'posts/follow.html'
-    context = {
-        'page_obj': page_obj,
-    }
-    return render(request, template, context)
+    authors, celebrities = followed_authors(request.user)
+    # Версия читается до постов: запись между ними сменит версию,
+    # и устаревший фрагмент не попадет в кэш под новой.
+    version = timeline_version(request.user, authors)
+    with fresh_reads(*timeline_scopes(request.user, authors)):
+        if celebrities:
+            posts = timeline_posts(
+                request.user, celebrities
+            ).select_related('author', 'group')
+            page_obj = get_paginator_pages(posts, request)
+        else:
+            page_obj = get_paginator_pages(
+                timeline_entries(request.user),
+                request,
+                ordering=TIMELINE_ORDERING
+            )
+            page_obj.object_list = [
+                entry.post for entry in page_obj.object_list
+            ]
+        template = 'posts/follow.html'
+        context = {
+            'page_obj': page_obj,
+            'cache_version': version,
+        }
+        return render(request, template, context)
 
 
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    if request.user != author:
+    if request.user != author and settings.WRITE_BEHIND:
+        outbox.follow(request.user, author.pk)
+    elif request.user != author:
         Follow.objects.get_or_create(user=request.user, author=author)
-        cache.clear()
+        pin_primary(request)
     return redirect('posts:profile', username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
+    if settings.WRITE_BEHIND:
+        outbox.unfollow(request.user, author.pk)
+        return redirect('posts:profile', username)
     Follow.objects.get(user=request.user, author=author).delete()
-    cache.clear()
+    pin_primary(request)
     return redirect('posts:profile', username)
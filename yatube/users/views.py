@@ -2,6 +2,8 @@ from django.views.generic import CreateView
 
 from django.urls import reverse_lazy
 
+from core.routers import pin_primary
+
 from .forms import CreationForm
 
 
@@ -10,3 +12,8 @@ class SignUp(CreateView):
     # После успешной регистрации перенаправляем пользователя на главную.
     success_url = reverse_lazy('users:login')
     template_name = 'users/signup.html'
+
+    def form_valid(self, form):
+        # Новый пользователь может еще не дойти до реплик.
+        pin_primary(self.request)
+        return super().form_valid(form)
@@ -38,10 +38,13 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,24 +68,83 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.cache.fragment_cache',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
+ASGI_APPLICATION = 'yatube.asgi.application'
 
 
 # Database
 
+# База с демо-данными хранится в git: для нее journal_mode не меняется
+# (core.signals), чтобы WAL не переписывал файл. В продакшене база
+# лежит по DATABASE_PATH.
+DEMO_DATABASE = os.path.join(BASE_DIR, 'db.sqlite3')
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.getenv('DATABASE_PATH', default=DEMO_DATABASE),
+        # Постоянные соединения: PRAGMA выполняются один раз
+        # на соединение, а не на каждый запрос.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default='60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Секунды ожидания блокировки записи вместо
+            # "database is locked".
+            'timeout': 20,
+        },
+    }
+}
+
+# Реплики только для чтения: пути к копиям базы через запятую,
+# например DATABASE_REPLICAS=/var/db/replica1.sqlite3. Локально копии
+# обновляет manage.py sync_replicas.
+REPLICA_DATABASES = []
+for number, name in enumerate(
+        filter(None, os.getenv('DATABASE_REPLICAS', default='').split(',')),
+        start=1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': name.strip(),
+        'TEST': {'MIRROR': 'default'},
     }
+    REPLICA_DATABASES.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Представления, которые читают с реплик
+REPLICA_VIEWS = (
+    'posts:index',
+    'posts:group_list',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:follow_index',
+)
+# Допустимое отставание реплик, секунды: столько после записи
+# в поколения кэша страницы с ними читаются с основной базы
+REPLICA_LAG = 2
+# Сколько после своей записи пользователь читает основную базу
+REPLICA_PIN_SECONDS = 15
+
+# Применяются к каждому новому соединению с SQLite (core.signals).
+# WAL: читатели не ждут писателя. synchronous=NORMAL в WAL безопасен
+# при сбое процесса. cache_size < 0 - размер в КиБ.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 20000,
+    'cache_size': -64000,
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', default=str(256 * 2**20))),
+    'temp_store': 'memory',
 }
 
 
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+
 # Password validation
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -102,7 +164,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 
 # Internationalization
-# https://docs.djangoproject.com/en/2.2/topics/i18n/
+# https://docs.djangoproject.com/en/4.2/topics/i18n/
 
 LANGUAGE_CODE = 'ru'
 
@@ -110,8 +172,6 @@ TIME_ZONE = 'W-SU'
 
 USE_I18N = True
 
-USE_L10N = True
-
 USE_TZ = True
 
 
@@ -130,16 +190,180 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 # Constans
 POST_ON_PAGE = 10
+COMMENTS_ON_PAGE = 20
+# Фрагменты лент версионируются и инвалидируются при записи,
+# поэтому живут долго
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 3
+# Страницы целиком для анонимных пользователей
+PAGE_CACHE_TIMEOUT = 60 * 60 * 3
+# Курсорная пагинация лент: ?after=<курсор> вместо ?page=<номер>
+KEYSET_PAGINATION = os.getenv('KEYSET_PAGINATION', default='False') == 'True'
+# Навигация по номерам: страниц по краям и по бокам от текущей
+PAGINATOR_ON_ENDS = 1
+PAGINATOR_ON_EACH_SIDE = 2
+# Количество постов для номерной пагинации берется из кэша
+# и пересчитывается в фоне раз в PAGINATOR_COUNT_TIMEOUT секунд
+PAGINATOR_CACHED_COUNT = (
+    os.getenv('PAGINATOR_CACHED_COUNT', default='False') == 'True'
+)
+PAGINATOR_COUNT_TIMEOUT = 60
+# Материализованные ленты подписок
+TIMELINE_LENGTH = 1000
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_BATCH_SIZE = 500
+# Загрузка файлов: всегда во временный файл на диске, тело больше
+# FILE_UPLOAD_MAX_SIZE отклоняется. У картинки проверяется только
+# заголовок: формат и число пикселей до декодирования.
+FILE_UPLOAD_HANDLERS = ['core.uploads.LimitedUploadHandler']
+FILE_UPLOAD_MAX_SIZE = int(
+    os.getenv('FILE_UPLOAD_MAX_SIZE', default=str(10 * 2**20))
+)
+IMAGE_UPLOAD_FORMATS = ('JPEG', 'MPO', 'PNG', 'GIF', 'WEBP')
+IMAGE_UPLOAD_MAX_PIXELS = 40 * 10**6
+# Варианты картинок постов разной ширины в WebP и JPEG для srcset
+# и миниатюры для ленты и страницы поста. Строятся в пуле из IMAGE_WORKERS
+# процессов, 0 - прямо в запросе.
+# Оригинал больше IMAGE_MAX_SIDE по длинной стороне уменьшается.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default='2'))
+IMAGE_VARIANT_WIDTHS = (320, 640, 960, 1920)
+IMAGE_MAX_SIDE = 2560
+IMAGE_QUALITY = {'webp': 80, 'jpeg': 82}
+# Поисковый индекс: fts5, terms (таблица SearchTerm) или auto -
+# FTS5, если SQLite собран с ним
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', default='auto')
+SEARCH_SNIPPET_WORDS = 30
+SEARCH_ADMIN_LIMIT = 1000
+# Число постов для TF-IDF индекса terms пересчитывается раз в час
+SEARCH_DOCUMENTS_TIMEOUT = 60 * 60
+# Отложенная запись комментариев и подписок: запрос добавляет запись
+# в очередь OUTBOX_PATH, в базу их пачками переносит
+# manage.py drain_outbox
+WRITE_BEHIND = os.getenv('WRITE_BEHIND', default='False') == 'True'
+OUTBOX_PATH = os.getenv(
+    'OUTBOX_PATH', default=os.path.join(BASE_DIR, 'outbox.sqlite3')
+)
+OUTBOX_BATCH_SIZE = 500
+# Пауза воркера очереди при пустой очереди, секунды
+OUTBOX_DRAIN_INTERVAL = 1.0
+
+# JSON API: постов на странице по умолчанию и максимум через ?limit=,
+# строк в одной пачке NDJSON-выгрузки
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+API_EXPORT_CHUNK = 2000
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Profiling
+# Доля профилируемых запросов (0 - выключено), порог медленного запроса
+# и каталог для дампов cProfile (пусто - cProfile не используется).
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', default='0'))
+PROFILING_SLOW_MS = float(os.getenv('PROFILING_SLOW_MS', default='500'))
+PROFILING_DUMP_DIR = os.getenv('PROFILING_DUMP_DIR', default='')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'yatube.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'yatube.outbox': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'yatube.benchmark': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Static files (CSS, JavaScript, Images)
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-
-CACHES = {
+# Загруженные файлы называются по SHA-256 содержимого (core.storage):
+# одинаковые хранятся один раз и удаляются с последней ссылкой.
+# MEDIA_STORAGE=local - в MEDIA_ROOT, s3 - в бакете MEDIA_S3_BUCKET
+# S3-совместимого хранилища (нужен boto3).
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', default='local')
+MEDIA_S3_BUCKET = os.getenv('MEDIA_S3_BUCKET', default='yatube')
+MEDIA_S3_ENDPOINT_URL = os.getenv('MEDIA_S3_ENDPOINT_URL', default='')
+# Адрес бакета для ссылок, по умолчанию MEDIA_S3_ENDPOINT_URL/бакет/
+MEDIA_S3_BASE_URL = os.getenv('MEDIA_S3_BASE_URL', default='')
+# Отдавать MEDIA_ROOT самим Django: только для разработки, в продакшене
+# медиа отдает веб-сервер или CDN (см. README)
+MEDIA_SERVE = os.getenv('MEDIA_SERVE', default=str(DEBUG)) == 'True'
+MEDIA_STORAGES = {
+    'local': 'core.storage.ContentAddressedStorage',
+    's3': 'core.storage.S3ContentAddressedStorage',
+}
+STORAGES = {
     'default': {
+        'BACKEND': MEDIA_STORAGES[MEDIA_STORAGE],
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# Миниатюры sorl называет и удаляет сам: им обычное хранилище
+THUMBNAIL_STORAGE = 'django.core.files.storage.FileSystemStorage'
+
+# Cache
+# CACHE_BACKEND=locmem - кэш внутри процесса (разработка, тесты),
+# CACHE_BACKEND=file - общий для всех воркеров кэш в CACHE_LOCATION:
+# каталог небольшой, при каждой записи Django перебирает все файлы.
+# CACHE_BACKEND=redis - общий кэш для продакшена, CACHE_LOCATION вида
+# redis://127.0.0.1:6379, нужен пакет redis.
+# CACHE_L1_TIMEOUT > 0 ставит перед общим кэшем кэш процесса.
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', default='locmem')
+CACHE_LOCATION = os.getenv(
+    'CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache')
+)
+CACHE_L1_TIMEOUT = int(os.getenv('CACHE_L1_TIMEOUT', default='0'))
+
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_LOCATION,
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+        },
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_LOCATION,
+    },
 }
+
+if CACHE_L1_TIMEOUT > 0:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {
+                'L1_TIMEOUT': CACHE_L1_TIMEOUT,
+                'L1_MAX_ENTRIES': 1000,
+            },
+        },
+        'shared': CACHE_BACKENDS[CACHE_BACKEND],
+    }
+else:
+    CACHES = {
+        'default': CACHE_BACKENDS[CACHE_BACKEND],
+    }